@@ -0,0 +1,209 @@
+"""
+Stage by stage benchmark of MapBuilder.parse.
+
+    python benchmarks/parse_bench.py [--sizes 16 32 64] [--kinds grid wfc sparse dense]
+        [--density 0.5] [--repeat 3] [--save base.json] [--compare base.json]
+        [--profile DIR] [--trace]
+
+Every case parses a synthetic bitmap with `getvisible=True` and `binary=True`
+into a temporary directory. Stage times come from the builder's INSTRUMENTS timers (best of
+`--repeat`), allocations from a separate tracemalloc run so that tracing does
+not skew the timings. `--compare` flags stages slower than the baseline by
+more than `--threshold`, and exits with 1 if any regressed.
+"""
+from argparse import ArgumentParser
+from functools import wraps
+from os.path import abspath, dirname, join
+from tempfile import TemporaryDirectory
+import cProfile
+import json
+import pstats
+import random
+import sys
+import tracemalloc
+import numpy as np
+
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, join(ROOT, 'src'))
+
+from instrument import INSTRUMENTS
+from map_builder import MapBuilder
+from utills import DuckieObject
+
+STAGES = ('_bitmap2duckie', '_duckie2signs', '_generateRandomObjects', '_getMapOfVisibleObjects', '_saveMap',
+          '_saveBinary')
+KINDS = ('grid', 'wfc', 'sparse', 'dense')
+
+def grid_city(size: int, rng: np.random.Generator, block: int = 4) -> np.ndarray:
+    bitmap = np.zeros((size, size), dtype=np.uint8)
+    bitmap[::block, :] = 255
+    bitmap[:, ::block] = 255
+    return bitmap
+
+def wfc_map(size: int, rng: np.random.Generator) -> np.ndarray:
+    from map_generator import MapGenerator
+
+    tiles = MapGenerator._loadTiles()
+    for state in MapGenerator.iterate((size, size), tiles):
+        pass
+    bitmap = MapGenerator.stateToBitmap(state, tiles, (size, size))
+    return np.where(bitmap > 127, 255, 0).astype(np.uint8)
+
+def sparse_roads(size: int, rng: np.random.Generator, fill: float = 0.1) -> np.ndarray:
+    """Random walks until `fill` of the cells are road"""
+    bitmap = np.zeros((size, size), dtype=np.uint8)
+    moves = np.array(((0, 1), (1, 0), (0, -1), (-1, 0)))
+    while np.mean(bitmap != 0) < fill:
+        position = rng.integers(0, size, 2)
+        for move in moves[rng.integers(0, 4, size)]:
+            bitmap[tuple(position)] = 255
+            position = np.clip(position + move, 0, size - 1)
+    return bitmap
+
+def dense_roads(size: int, rng: np.random.Generator, fill: float = 0.6) -> np.ndarray:
+    return np.where(rng.random((size, size)) < fill, 255, 0).astype(np.uint8)
+
+BITMAPS = dict(grid=grid_city, wfc=wfc_map, sparse=sparse_roads, dense=dense_roads)
+
+def scatter_objects(bitmap: np.ndarray, density: float, rng: np.random.Generator) -> list[DuckieObject]:
+    """`density` objects per cell at uniform positions, in object coordinates"""
+    w, h = bitmap.shape
+    count = int(density * w * h)
+    rows, cols = rng.uniform(0, w, count), rng.uniform(0, h, count)
+    return [DuckieObject('duckie', 0, round(float(col), 2), round(float(row - w + h - 1), 2), 0.1)
+            for row, col in zip(rows, cols)]
+
+def _parse(bitmap: np.ndarray, objects: list, out: str) -> None:
+    random.seed(0)
+    np.random.seed(0)
+    MapBuilder.parse(join(out, 'bench'), bitmap, random=True, getvisible=True, objects=objects, binary=True)
+
+def _stageTimes() -> dict[str, float]:
+    series = INSTRUMENTS.summary()['series']
+    return {name.split('.', 1)[1]: stats['total'] for name, stats in series.items() if name.startswith('builder.')}
+
+def _stageAllocations(bitmap: np.ndarray, objects: list, out: str) -> dict[str, float]:
+    """Peak traced KiB per stage and for the whole parse"""
+    peaks = dict()
+    # reset_peak() also drops the parse-wide peak, so the stages keep it here
+    outer = [0]
+    originals = {stage: getattr(MapBuilder, stage) for stage in STAGES}
+
+    def traced(stage, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            before, peak = tracemalloc.get_traced_memory()
+            outer[0] = max(outer[0], peak)
+            tracemalloc.reset_peak()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                peak = tracemalloc.get_traced_memory()[1]
+                outer[0] = max(outer[0], peak)
+                peaks[stage.lstrip('_')] = (peak - before) / 1024
+        return wrapper
+
+    for stage, fn in originals.items():
+        setattr(MapBuilder, stage, traced(stage, fn))
+    tracemalloc.start()
+    try:
+        _parse(bitmap, objects, out)
+        peaks['parse'] = max(outer[0], tracemalloc.get_traced_memory()[1]) / 1024
+    finally:
+        tracemalloc.stop()
+        for stage, fn in originals.items():
+            setattr(MapBuilder, stage, fn)
+    assert peaks['parse'] >= max(peak for stage, peak in peaks.items() if stage != 'parse'), \
+        f'[parse_bench] Parse peak {peaks["parse"]:.0f} KiB is below a stage peak'
+    return peaks
+
+def run_case(kind: str, size: int, density: float, repeat: int, profile: str = None,
+             trace: bool = False) -> dict:
+    rng = np.random.default_rng(size)
+    np.random.seed(size)
+    random.seed(size)
+    bitmap = BITMAPS[kind](size, rng)
+    objects = scatter_objects(bitmap, density, rng)
+
+    with TemporaryDirectory() as out:
+        times: dict[str, float] = dict()
+        for _ in range(repeat):
+            INSTRUMENTS.reset()
+            _parse(bitmap, objects, out)
+            for stage, ms in _stageTimes().items():
+                times[stage] = min(times.get(stage, np.inf), ms)
+
+        allocations = _stageAllocations(bitmap, objects, out)
+
+        if profile:
+            profiler = cProfile.Profile()
+            profiler.runcall(_parse, bitmap, objects, out)
+            path = join(profile, f'{kind}_{size}.prof')
+            profiler.dump_stats(path)
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+
+        if trace:
+            tracemalloc.start(10)
+            _parse(bitmap, objects, out)
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            for stat in snapshot.statistics('lineno')[:10]:
+                print(f'    {stat}')
+
+    return dict(kind=kind, size=size, density=density, road=float(np.mean(bitmap != 0)),
+                objects=len(objects), ms=times, kib=allocations)
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    base = {(case['kind'], case['size'], case['density']): case for case in baseline}
+    regressions = []
+    for case in results:
+        old = base.get((case['kind'], case['size'], case['density']))
+        if old is None:
+            continue
+        for stage, ms in case['ms'].items():
+            before = old['ms'].get(stage)
+            # sub-millisecond stages are dominated by noise
+            if before is not None and ms > max(before, 1.0) * threshold:
+                regressions.append(f'{case["kind"]:<7}{case["size"]:>5} x{case["density"]:<5g} {stage:<24}{before:9.2f} -> {ms:9.2f} ms')
+    return regressions
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[16, 32, 64])
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+    parser.add_argument('--density', type=float, default=0.5, help='extra objects per cell')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='write results as JSON baseline')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio counted as regression')
+    parser.add_argument('--profile', help='directory for cProfile dumps, one per case')
+    parser.add_argument('--trace', action='store_true', help='print top tracemalloc allocation sites')
+    args = parser.parse_args()
+
+    results = []
+    for kind in args.kinds:
+        for size in args.sizes:
+            case = run_case(kind, size, args.density, args.repeat, args.profile, args.trace)
+            results.append(case)
+            stages = '  '.join(f'{stage.lstrip("_")} {case["ms"].get(stage.lstrip("_"), 0.0):.2f}'
+                               for stage in STAGES)
+            print(f'{kind:<7}{size:>5}  road {case["road"]:4.0%}  objects {case["objects"]:6d}  '
+                  f'parse {case["ms"].get("parse", 0.0):9.2f} ms  peak {case["kib"]["parse"]:9.0f} KiB')
+            print(f'    ms: {stages}')
+            print('    KiB: ' + '  '.join(f'{stage.lstrip("_")} {case["kib"].get(stage.lstrip("_"), 0.0):.0f}'
+                                       for stage in STAGES))
+
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(results, out, indent=1)
+
+    if args.compare:
+        with open(args.compare) as base:
+            regressions = compare(results, json.load(base), args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Startup time of the headless and GUI entry points.
+
+    python benchmarks/startup.py [--repeat 10]
+
+Every sample is a fresh interpreter importing one module with `src` on the
+path. Also reports which heavy dependencies each import pulled in.
+"""
+from argparse import ArgumentParser
+from os.path import abspath, dirname, join
+from statistics import median
+from time import perf_counter
+import json
+import os
+import subprocess
+import sys
+
+ROOT = dirname(dirname(abspath(__file__)))
+HEAVY = ('cv2', 'PIL', 'bridson', 'pygame', 'OpenGL', 'imgui')
+TARGETS = ('headless', 'map_builder', 'model.model', 'map_generator', 'src.view.imgui_view')
+
+_PROBE = ('import sys, json; import {module}; '
+          'print(json.dumps([m for m in {heavy!r} if m in sys.modules]))')
+
+def measure(module: str, repeat: int) -> dict:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join((join(ROOT, 'src'), ROOT)))
+    samples, loaded = [], None
+
+    for _ in range(repeat):
+        start = perf_counter()
+        done = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY)],
+                              env=env, cwd=ROOT, capture_output=True, text=True)
+        samples.append((perf_counter() - start) * 1000.0)
+        if done.returncode != 0:
+            return dict(module=module, error=done.stderr.strip().splitlines()[-1])
+        loaded = json.loads(done.stdout)
+
+    return dict(module=module, min_ms=min(samples), median_ms=median(samples), heavy=loaded)
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--baseline', action='store_true', help='also time a bare interpreter')
+    args = parser.parse_args()
+
+    targets = (('sys',) if args.baseline else ()) + TARGETS
+    for module in targets:
+        res = measure(module, args.repeat)
+        if 'error' in res:
+            print(f'{module:<18} failed: {res["error"]}')
+        else:
+            print(f'{module:<18} min {res["min_ms"]:7.1f} ms  median {res["median_ms"]:7.1f} ms  heavy {res["heavy"]}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Batch entry point that never imports pygame, OpenGL or imgui.
+
+    PYTHONPATH=src python headless.py [--stats stats.json] parse map.npy name [--inject] [--random] [--binary]
+        [--visible [--workers N]]
+    PYTHONPATH=src python headless.py generate 10 10 map.npy [--count N]
+    PYTHONPATH=src python headless.py thumbnails maps/
+"""
+from argparse import ArgumentParser
+import sys
+import numpy as np
+
+from instrument import INSTRUMENTS
+
+def _loadBitmap(path: str) -> np.ndarray:
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+
+    from PIL import Image
+    return np.asarray(Image.open(path).convert('L'))
+
+def parse(args) -> None:
+    from map_builder import MapBuilder
+
+    MapBuilder.parse(args.name, _loadBitmap(args.bitmap), inject=args.inject, random=args.random,
+                     binary=args.binary, getvisible=args.visible, workers=args.workers)
+
+def generate(args) -> None:
+    from map_generator import MapGenerator
+
+    if args.count == 1:
+        np.save(args.out, MapGenerator.generate((args.width, args.height)))
+        return
+
+    stem = args.out[:-4] if args.out.endswith('.npy') else args.out
+    for i, bitmap in enumerate(MapGenerator.generateBatch(args.count, (args.width, args.height))):
+        np.save(f'{stem}_{i}.npy', bitmap)
+
+def thumbnails(args) -> None:
+    from thumbnails import ThumbnailCache
+
+    for path in ThumbnailCache.scan(args.directory):
+        ThumbnailCache.build(path)
+
+def main(argv: list[str] = None) -> None:
+    parser = ArgumentParser(description='Duckietown map builder without GUI')
+    parser.add_argument('--stats', help='write timing statistics as JSON')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parse_parser = commands.add_parser('parse', help='convert a road bitmap into a Duckietown map')
+    parse_parser.add_argument('bitmap', help='.npy or image file, road cells are 255')
+    parse_parser.add_argument('name')
+    parse_parser.add_argument('--inject', action='store_true')
+    parse_parser.add_argument('--random', action='store_true')
+    parse_parser.add_argument('--binary', action='store_true', help='also write a .npz map archive')
+    parse_parser.add_argument('--visible', action='store_true', help='compute the objects visible from every cell')
+    parse_parser.add_argument('--workers', type=int, default=1, help='processes for the --visible pass')
+    parse_parser.set_defaults(run=parse)
+
+    generate_parser = commands.add_parser('generate', help='generate a road bitmap with WFC')
+    generate_parser.add_argument('width', type=int)
+    generate_parser.add_argument('height', type=int)
+    generate_parser.add_argument('out', help='.npy output file')
+    generate_parser.add_argument('--count', type=int, default=1,
+                                 help='distinct maps up to rotation and reflection, saved as out_<i>.npy')
+    generate_parser.set_defaults(run=generate)
+
+    thumbnails_parser = commands.add_parser('thumbnails', help='build thumbnail caches of the maps in a directory')
+    thumbnails_parser.add_argument('directory')
+    thumbnails_parser.set_defaults(run=thumbnails)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+    if args.stats:
+        INSTRUMENTS.dump(args.stats)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,12 +1,19 @@
-from model.model import DataStock
+from model.session import SessionStore
 from view.imgui_view import PygameImguiView
 
+SESSION_PATH = '~/.local/share/duckietown-mapbuilder/session'
+
 def main():
-    stock = DataStock()
+    session = SessionStore(SESSION_PATH)
+    stock = session.restore()
+    session.startAutosave(stock)
+
     view = PygameImguiView()
-    view.setup(stock, size=(800,600))
+    view.setup(stock, size=(800,600), session=session)
     view.run()
 
+    session.stopAutosave()
+    session.save(stock)
+
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,100 @@
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Optional
+import atexit
+import json
+import os
+import numpy as np
+
+class Instruments:
+    """
+    Scoped timers, counters and fixed-size value histories.
+
+    Timers record milliseconds. Everything is kept in ring buffers of
+    `history` samples, so instrumenting the frame loop costs constant memory.
+    """
+    def __init__(self, history: int = 240):
+        self.history = history
+        self._series: dict[str, deque] = dict()
+        self._totals: dict[str, list] = dict()
+        self._counters: dict[str, int] = dict()
+        self._lock = Lock()
+
+    def record(self, name: str, value: float) -> None:
+        with self._lock:
+            if name not in self._series:
+                self._series[name] = deque(maxlen=self.history)
+                self._totals[name] = [0, 0.0, -np.inf]
+            self._series[name].append(value)
+            totals = self._totals[name]
+            totals[0] += 1
+            totals[1] += value
+            totals[2] = max(totals[2], value)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (perf_counter() - start) * 1000.0)
+
+    def timed(self, name: Optional[str] = None) -> Callable:
+        """Decorator timing every call of a function"""
+        def decorator(fn: Callable) -> Callable:
+            label = name or fn.__qualname__
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(label):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def getHistory(self, name: str) -> np.ndarray:
+        with self._lock:
+            return np.array(self._series.get(name, ()), dtype=np.float32)
+
+    def getNames(self) -> list[str]:
+        with self._lock:
+            return sorted(self._series.keys())
+
+    def getCounters(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def summary(self) -> dict:
+        with self._lock:
+            series = {name: np.array(values, dtype=np.float64) for name, values in self._series.items()}
+            totals = {name: list(values) for name, values in self._totals.items()}
+            counters = dict(self._counters)
+
+        stats = dict()
+        for name, values in series.items():
+            calls, total, peak = totals[name]
+            stats[name] = dict(calls=calls, total=total, mean=total / calls, max=peak,
+                               last=float(values[-1]), p95=float(np.percentile(values, 95)))
+        return dict(series=stats, counters=counters)
+
+    def dump(self, path: str) -> None:
+        with open(path, 'w') as out:
+            json.dump(self.summary(), out, indent=1)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+            self._totals.clear()
+            self._counters.clear()
+
+
+INSTRUMENTS = Instruments()
+
+# headless runs export their measurements with MAPBUILDER_STATS=path.json
+if os.environ.get('MAPBUILDER_STATS'):
+    atexit.register(lambda: INSTRUMENTS.dump(os.environ['MAPBUILDER_STATS']))
@@ -0,0 +1,162 @@
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import count
+from threading import Event, Lock
+from typing import Any, Callable, Optional
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """Handle of a background job, safe to read from the frame loop"""
+    PENDING   = 'pending'
+    RUNNING   = 'running'
+    DONE      = 'done'
+    FAILED    = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, job_id: int, label: str,
+                 onDone: Optional[Callable[[Any], None]] = None,
+                 onError: Optional[Callable[[BaseException], None]] = None):
+        self.id = job_id
+        self.label = label
+        self.state = Job.PENDING
+        self.progress = 0.0
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self._onDone = onDone
+        self._onError = onError
+        self._cancel = Event()
+        self._future: Optional[Future] = None
+
+    def cancel(self) -> None:
+        """Requests cancellation, a running job stops at its next progress report"""
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self.state = Job.CANCELLED
+
+    def isCancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def isFinished(self) -> bool:
+        return self.state in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    def report(self, fraction: float) -> None:
+        """Progress callback for the job function, raises JobCancelled once cancelled"""
+        if self._cancel.is_set():
+            raise JobCancelled(self.label)
+        self.state = Job.RUNNING
+        self.progress = min(max(fraction, 0.0), 1.0)
+
+    def _run(self, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        self.report(0.0)
+        return fn(*args, progress=self.report, **kwargs)
+
+
+class JobScheduler:
+    """
+    Runs generate/parse/load work off the render thread.
+
+    Thread jobs get a `progress` keyword callback which reports a fraction
+    in [0, 1] and aborts the job when it was cancelled. Process jobs run in
+    a separate process pool for CPU-bound work and can only be cancelled
+    before they start, they turn RUNNING once the pool picks them up.
+    Completion callbacks run inside `poll`, so they are free to touch the
+    GUI state, a callback raising marks its job FAILED.
+    """
+    def __init__(self, threads: int = 2, processes: int = 2):
+        self._threads = ThreadPoolExecutor(threads, thread_name_prefix='job')
+        self._process_count = processes
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._ids = count(1)
+        self._jobs: list[Job] = []
+        self._lock = Lock()
+        self._reported: dict[int, tuple[str, float]] = dict()
+
+    def submit(self, label: str, fn: Callable, *args,
+               onDone: Optional[Callable[[Any], None]] = None,
+               onError: Optional[Callable[[BaseException], None]] = None,
+               process: bool = False, **kwargs) -> Job:
+        job = Job(next(self._ids), label, onDone, onError)
+
+        if process:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(self._process_count)
+            job._future = self._processes.submit(fn, *args, **kwargs)
+        else:
+            job._future = self._threads.submit(job._run, fn, args, kwargs)
+
+        with self._lock:
+            self._jobs.append(job)
+
+        print(f'[Jobs][submit] {label}')
+        return job
+
+    def getJobs(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs)
+
+    def hasUpdates(self) -> bool:
+        """Whether `poll` would change anything, without running callbacks"""
+        for job in self.getJobs():
+            if job._future.done() or (job.state == Job.PENDING and job._future.running()):
+                return True
+            if self._reported.get(job.id) != (job.state, job.progress):
+                return True
+        return False
+
+    def poll(self) -> int:
+        """Finishes completed jobs on the calling thread, returns how many jobs changed state or progress"""
+        changed = 0
+
+        for job in self.getJobs():
+            if job.state == Job.PENDING and job._future.running():
+                job.state = Job.RUNNING
+            state = (job.state, job.progress)
+            if self._reported.get(job.id) != state:
+                self._reported[job.id] = state
+                changed += 1
+
+            if not job._future.done():
+                continue
+
+            with self._lock:
+                self._jobs.remove(job)
+            self._reported.pop(job.id, None)
+            changed += 1
+
+            if job._future.cancelled():
+                job.state = Job.CANCELLED
+                continue
+
+            error = job._future.exception()
+            if isinstance(error, JobCancelled):
+                job.state = Job.CANCELLED
+                print(f'[Jobs][poll] {job.label} cancelled')
+            elif error is not None:
+                job.state, job.error = Job.FAILED, error
+                print(f'[Jobs][poll] {job.label} failed: {error}')
+                self._callback(job, job._onError, error)
+            else:
+                job.state, job.progress = Job.DONE, 1.0
+                job.result = job._future.result()
+                self._callback(job, job._onDone, job.result)
+
+        return changed
+
+    def _callback(self, job: Job, callback: Optional[Callable[[Any], None]], value: Any) -> None:
+        if callback is None:
+            return
+        try:
+            callback(value)
+        except Exception as e:
+            print(f'[Jobs][poll] {job.label} callback failed: {type(e).__name__}: {e}')
+            job.state, job.error = Job.FAILED, e
+
+    def shutdown(self, cancel: bool = True) -> None:
+        if cancel:
+            for job in self.getJobs():
+                job.cancel()
+        self._threads.shutdown(wait=True, cancel_futures=cancel)
+        if self._processes is not None:
+            self._processes.shutdown(wait=True, cancel_futures=cancel)
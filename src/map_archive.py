@@ -0,0 +1,95 @@
+from dataclasses import dataclass, field
+from typing import Sequence
+import json
+import numpy as np
+
+from utills import DuckieMap, DuckieObject
+
+# tile names by code, new kinds must be appended to keep old archives readable
+TILE_KINDS = ('floor',
+              'straight/W', 'straight/N',
+              'curve_left/N', 'curve_left/E', 'curve_left/S', 'curve_left/W',
+              '3way_left/N', '3way_left/E', '3way_left/S', '3way_left/W',
+              '4way')
+_TILE_CODES = {kind: code for code, kind in enumerate(TILE_KINDS)}
+
+@dataclass(init=True, repr=False, eq=False, frozen=True)
+class MapArchive:
+    """
+    Binary form of a parsed map, stored as one `.npz` next to the YAML export.
+
+    Everything is a plain array, so reading needs neither pickle nor text
+    parsing: the road bitmap, a grid of TILE_KINDS codes, objects as columns
+    (kind code into `kinds`, position, rotation, height, sign flag) and the
+    parse metadata as JSON bytes.
+    """
+    bitmap: np.ndarray
+    tiles: np.ndarray
+    kinds: tuple[str, ...]
+    object_kind: np.ndarray
+    object_pos: np.ndarray
+    object_rotate: np.ndarray
+    object_height: np.ndarray
+    object_sign: np.ndarray
+    meta: dict = field(default_factory=dict)
+
+    FORMAT = 1
+
+    def of(bitmap: np.ndarray, duckie: DuckieMap, signs: Sequence[DuckieObject],
+           objects: Sequence[DuckieObject], **meta) -> 'MapArchive':
+        every = list(signs) + list(objects)
+        kinds = tuple(sorted({obj.type for obj in every}))
+        codes = {kind: code for code, kind in enumerate(kinds)}
+
+        return MapArchive(
+            np.asarray(bitmap, dtype=np.uint8),
+            MapArchive.tileCodes(duckie.tiles),
+            kinds,
+            np.array([codes[obj.type] for obj in every], dtype=np.int16),
+            np.array([(obj.x, obj.y) for obj in every], dtype=np.float32).reshape(-1, 2),
+            np.array([obj.rotate for obj in every], dtype=np.int16),
+            np.array([obj.height for obj in every], dtype=np.float32),
+            np.arange(len(every)) < len(signs),
+            dict(meta, format=MapArchive.FORMAT))
+
+    def tileCodes(tiles: Sequence[Sequence[str]]) -> np.ndarray:
+        """Grid of TILE_KINDS codes for a grid of tile names"""
+        return np.array([[_TILE_CODES[tile] for tile in row] for row in tiles], dtype=np.uint8)
+
+    def save(self, path: str, *, compress: bool = True) -> None:
+        write = np.savez_compressed if compress else np.savez
+        with open(path, 'wb') as out:
+            write(out,
+                  bitmap=self.bitmap, tiles=self.tiles,
+                  kinds=np.array(self.kinds, dtype=str),
+                  object_kind=self.object_kind, object_pos=self.object_pos,
+                  object_rotate=self.object_rotate, object_height=self.object_height,
+                  object_sign=self.object_sign,
+                  meta=np.frombuffer(json.dumps(self.meta).encode(), dtype=np.uint8))
+
+    def load(path: str) -> 'MapArchive':
+        with np.load(path, allow_pickle=False) as archive:
+            meta = json.loads(archive['meta'].tobytes().decode())
+            if meta.get('format', 0) > MapArchive.FORMAT:
+                raise Exception(f'[MapArchive][load] Unsupported format {meta["format"]} of \'{path}\'')
+
+            return MapArchive(archive['bitmap'], archive['tiles'], tuple(archive['kinds'].tolist()),
+                              archive['object_kind'], archive['object_pos'], archive['object_rotate'],
+                              archive['object_height'], archive['object_sign'], meta)
+
+    def tileNames(self) -> list[list[str]]:
+        return np.array(TILE_KINDS, dtype=object)[self.tiles].tolist()
+
+    def toDuckie(self) -> DuckieMap:
+        return DuckieMap(self.tileNames(), *self.tiles.shape)
+
+    def objects(self) -> tuple[list[DuckieObject], list[DuckieObject]]:
+        """Signs and other objects"""
+        # columns are float32, rounding drops the float32 noise of the two decimal values
+        every = [DuckieObject(self.kinds[kind], int(rotate), round(float(x), 4), round(float(y), 4),
+                              round(float(height), 4))
+                 for kind, (x, y), rotate, height
+                 in zip(self.object_kind, self.object_pos, self.object_rotate, self.object_height)]
+        signs = [obj for obj, sign in zip(every, self.object_sign) if sign]
+        others = [obj for obj, sign in zip(every, self.object_sign) if not sign]
+        return signs, others
@@ -1,14 +1,12 @@
-from bridson import poisson_disc_samples as pds
 from utills import *
-from typing import Tuple
-from os.path import expanduser
+from instrument import INSTRUMENTS
+from typing import Callable, Optional, Sequence, Tuple
+from os.path import expanduser, exists
+from map_archive import MapArchive, TILE_KINDS
+from multiprocessing.shared_memory import SharedMemory
 import numpy as np
 import random
 
-import cv2
-
-from map_generator import MapGenerator
-
 view = np.zeros((1, 1))
 scale = 1.0
 
@@ -36,62 +34,39 @@ class MapBuilder:
              '3way_left/N':  DuckieObject.getSignsFor3wayN,
              '4way':         DuckieObject.getSignsFor4way}
 
-    def _countNeighbors(bitmap: np.ndarray, x: int, y: int) -> int:
+    # neighbour order of the _TILE keys: (0, 1), (1, 0), (0, -1), (-1, 0)
+    _MOVES = (Direction.RIGHT, Direction.DOWN, Direction.LEFT, Direction.UP)
+
+    def _neighbourMask(bitmap: np.ndarray) -> np.ndarray:
+        """(4, width, height) booleans in _MOVES order, mask[n, x, y] if (x, y) is road and has a neighbour in _MOVES[n]"""
         width, height = bitmap.shape
-        count = 0
+        topology = GridTopology.of(width, height)
 
-        moves = ((0, 1), (1, 0), (0, -1), (-1, 0))
+        mask = topology.neighborMask(bitmap == 255)[[move.value for move in MapBuilder._MOVES]]
+        return mask & (bitmap != 0)
 
-        for dx, dy in moves:
-            if width > x + dx >= 0      \
-                and height > y + dy >= 0 \
-                and bitmap[x+dx][y+dy] == 255:
-                count += 1
-        
-        return count
-
-    def _hasNeighbours(bitmap: np.ndarray, x: int, y: int) -> Tuple[bool]:
-        """if (x + dx_n, y + dy_n) has neigbour, then neighbour[n] is True"""
-        if bitmap[x][y] == 0:
-            return (False,) * 4
-
-        width, height = bitmap.shape
-        moves = ((0, 1), (1, 0), (0, -1), (-1, 0))
-        
-        neighbour = [False, ] * 4
-        
-        for i, (dx, dy) in enumerate(moves):
-            neighbour[i] = width > x + dx >= 0 \
-                and height > y + dy >= 0        \
-                and bitmap[x+dx][y+dy] == 255
-          
-        return tuple(neighbour)
+    def _tileCodes() -> np.ndarray:
+        """Tile name for every 4 bit neighbour code, bit n is set for a neighbour in _MOVES[n]"""
+        codes = np.empty(16, dtype=object)
+        for table in MapBuilder._TILE.values():
+            for neighbours, tile in table.items():
+                codes[sum(1 << n for n, has in enumerate(neighbours) if has)] = tile
+        return codes
 
+    @INSTRUMENTS.timed('builder.bitmap2duckie')
     def _bitmap2duckie(bitmap: np.ndarray) -> DuckieMap:
         """Make Duckietown Map from bitmap"""
 
         width, height = bitmap.shape
-        
-        neighbours_count = np.zeros((width, height))
-
-        for i in range (0, width):
-            for j in range (0, height):
-                if bitmap[i][j] != 0:
-                    neighbours_count[i][j] = MapBuilder._countNeighbors(bitmap, i, j)
-                    
-        tiles = [['floor' for i in range(height)] for j in range(width)]
-
-        for i in range (0, width):
-            for j in range (0, height):
-                has_neighbour = MapBuilder._hasNeighbours(bitmap, i, j)
-                
-                COUNT     = neighbours_count[i][j]
-                NEIGHBOURS = has_neighbour
-                
-                tiles[i][j] = MapBuilder._TILE[COUNT][NEIGHBOURS]
-        
+
+        mask = MapBuilder._neighbourMask(bitmap)
+        codes = np.tensordot(np.array((1, 2, 4, 8)), mask, axes=1)
+
+        tiles = MapBuilder._tileCodes()[codes].tolist()
+
         return DuckieMap(tiles, width, height)
-   
+
+    @INSTRUMENTS.timed('builder.duckie2signs')
     def _duckie2signs(duckie: DuckieMap) -> Tuple[DuckieObject]:
         """Make sequence of Signs based on a Duckietown Map"""
 
@@ -110,6 +85,7 @@ class MapBuilder:
                 
         return signs
 
+    @INSTRUMENTS.timed('builder.generateRandomObjects')
     def _generateRandomObjects(map_size: Tuple[int, int]) -> Tuple[DuckieObject]:
         objects = ['tree', 'duckie']                  # add object
         hbounds = {'tree':   DuckieBHeight(0.3, 0.5), # add bounds
@@ -118,6 +94,8 @@ class MapBuilder:
         round2f = lambda f: float(f'{f:.2f}')
 
         width, height = map_size
+        from bridson import poisson_disc_samples as pds
+
         positions = pds(width, height, r=0.65)
 
         res = [
@@ -130,26 +108,42 @@ class MapBuilder:
 
         return res
 
-    def _getMapOfVisibleObjects(bitmap: np.ndarray,
-                            duckie: DuckieMap, 
-                            objects: Tuple[DuckieObject]) -> list[list[list[DuckieObject]]]:
+    def _visibleCells(bitmap: np.ndarray, codes: np.ndarray, positions: np.ndarray,
+                      x_begin: int, x_end: int) -> np.ndarray:
+        """
+        (K, 3) rows of (x, y, object index) for every object inside the area of road cell (x, y)
+        and its road neighbours, for x_begin <= x < x_end. `codes` are TILE_KINDS codes and
+        `positions` object coordinates converted to map coordinates
+        """
         global view, scale
-        
+
         w, h = bitmap.shape[:2]
-        moves = ((0, 1), (1, 0), (0, -1), (-1, 0))
-        
-        coords_obj2map = lambda x, y: (y + w - h + 1, x)
+        neighbors = GridTopology.of(w, h).neighbors
+        road = np.append(bitmap.ravel() != 0, False)
 
-        result = [[[] for i in range(h)] for j in range(w)]
-        
-        for x in range(w):
+        # the area of a cell reaches one cell into its neighbours
+        cells = np.floor(positions).astype(np.int64)
+        buckets = dict()
+        for i in np.flatnonzero((x_begin - 2 <= cells[:, 0]) & (cells[:, 0] <= x_end + 1)):
+            buckets.setdefault((cells[i, 0], cells[i, 1]), []).append(i)
+
+        found = []
+
+        for x in range(x_begin, x_end):
             for y in range(h):
                 if bitmap[x][y] == 0: 
                     continue
-                
+
+                candidates = sorted(i for dx in range(-1, 3) for dy in range(-1, 3)
+                                    for i in buckets.get((x + dx, y + dy), ()))
+                if not candidates:
+                    continue
+
                 cx, cy = x + 0.5, y + 0.5
                 
-                area = ComplexArea(get_duckietile_area(duckie.tiles[x][y])(cx, cy))
+                # tile areas are cached at the origin, so every area goes with its center,
+                # points within float rounding of an area edge may fall the other way than with absolute bounds
+                areas = [(duckietile_area(TILE_KINDS[codes[x, y]]), cx, cy)]
 
                 # if duckie.tiles[x][y].startswith('curve_left'):
                 #     area_sect = area.get(0).get(0)
@@ -160,21 +154,83 @@ class MapBuilder:
                 #         int(area_sect.theta_min/np.pi*180), int(area_sect.theta_max/np.pi*180), 128, thickness=5)
                 #     (0.5, 7.5) in area_sect
 
-                for dx, dy in moves:
-                    if not (0 <= x + dx < w and 0 <= y + dy < h):
-                        continue
-                    if bitmap[x+dx, y+dy] == 0:
+                for direction in Direction:
+                    if not road[neighbors[direction.value, x*h + y]]:
                         continue
-                    area.append(get_duckietile_area(duckie.tiles[x+dx][y+dy])(cx+dx, cy+dy))
+                    dx, dy = direction.offset
+                    areas.append((duckietile_area(TILE_KINDS[codes[x+dx, y+dy]]), cx+dx, cy+dy))
+
+                for i in candidates:
+                    px, py = float(positions[i, 0]), float(positions[i, 1])
+                    if any((px - ax, py - ay) in area for area, ax, ay in areas):
+                        found.append((x, y, i))
+
+        return np.array(found, dtype=np.int64).reshape(-1, 3)
+
+    def _visibleBand(shared: dict[str, tuple[str, tuple, str]], x_begin: int, x_end: int) -> np.ndarray:
+        """Worker side of the parallel visibility pass, arrays are attached from shared memory by name"""
+        blocks = {key: SharedMemory(name) for key, (name, _, _) in shared.items()}
+        try:
+            arrays = {key: np.ndarray(shape, dtype, buffer=blocks[key].buf)
+                      for key, (_, shape, dtype) in shared.items()}
+            found = MapBuilder._visibleCells(arrays['bitmap'], arrays['codes'], arrays['positions'], x_begin, x_end)
+            del arrays
+            return found
+        finally:
+            for block in blocks.values():
+                block.close()
+
+    def _visibleParallel(bitmap: np.ndarray, codes: np.ndarray, positions: np.ndarray, workers: int) -> np.ndarray:
+        """Splits the rows into bands processed by `workers` processes on shared copies of the arrays"""
+        from concurrent.futures import ProcessPoolExecutor
+
+        blocks, shared = [], dict()
+        try:
+            for key, array in (('bitmap', bitmap), ('codes', codes), ('positions', positions)):
+                block = SharedMemory(create=True, size=max(array.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+                shared[key] = (block.name, array.shape, array.dtype.str)
+
+            # a few bands per worker balance uneven road density
+            bounds = np.linspace(0, bitmap.shape[0], min(workers * 4, bitmap.shape[0]) + 1).astype(int)
+            with ProcessPoolExecutor(workers) as pool:
+                bands = pool.map(MapBuilder._visibleBand, [shared] * (len(bounds) - 1), bounds[:-1], bounds[1:])
+                return np.concatenate(list(bands))
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    @INSTRUMENTS.timed('builder.getMapOfVisibleObjects')
+    def _getMapOfVisibleObjects(bitmap: np.ndarray,
+                            duckie: DuckieMap, 
+                            objects: Tuple[DuckieObject],
+                            workers: int = 1) -> list[list[list[DuckieObject]]]:
+        """Objects visible from every cell, `workers` > 1 computes row bands in parallel processes"""
+        w, h = bitmap.shape[:2]
+
+        coords_obj2map = lambda x, y: (y + w - h + 1, x)
+
+        result = [[[] for i in range(h)] for j in range(w)]
+        if not objects:
+            return result
+
+        bitmap = np.ascontiguousarray(bitmap, dtype=np.uint8)
+        codes = MapArchive.tileCodes(duckie.tiles)
+        positions = np.array([coords_obj2map(obj.x, obj.y) for obj in objects], dtype=np.float64)
+
+        if workers > 1:
+            found = MapBuilder._visibleParallel(bitmap, codes, positions, workers)
+        else:
+            found = MapBuilder._visibleCells(bitmap, codes, positions, 0, w)
 
-                for obj in objects:
-                    ox, oy = coords_obj2map(obj.x, obj.y)
-                    if  (ox, oy) in area:
-                        # result[x][y].append((obj.type, (ox, oy), duckie.tiles[x][y]))
-                        result[x][y].append(obj)
+        for x, y, i in found.tolist():
+            result[x][y].append(objects[i])
 
         return result
 
+    @INSTRUMENTS.timed('builder.saveMap')
     def _saveMap(file_name: str, 
                 duckie: DuckieMap, 
                 signs: Tuple[DuckieObject], 
@@ -204,21 +260,51 @@ class MapBuilder:
 
             file_map.write('tile_size: 0.585')
     
+    @INSTRUMENTS.timed('builder.saveBinary')
+    def _saveBinary(file_name: str,
+                bitmap: np.ndarray,
+                duckie: DuckieMap,
+                signs: Tuple[DuckieObject],
+                randomness: Tuple[DuckieObject],
+                **meta):
+        """Saves the binary container next to the text map"""
+        MapArchive.of(bitmap, duckie, signs, randomness, **meta).save(file_name)
+
     def load(name: str) -> np.ndarray:
-        """TODO: load bitmap from file"""
+        """Loads the bitmap of a map parsed with `binary=True` or of a `.npy` file, text maps are not read"""
         print(f'[MapBuilder] Load \'{name}\'')
 
-        bitmap = np.full((10, 10), 255, dtype=np.uint8)
-
-        return bitmap
-
-    def parse(name: str, bitmap: np.ndarray, *, inject=False, random=False, getvisible=False):
-        """Parses bitmap and writes it file"""
+        if name.endswith('.npy') and exists(expanduser(name)):
+            return np.load(expanduser(name))
+
+        path = expanduser(name if name.endswith('.npz') else f'{name}.npz')
+        if exists(path):
+            return MapArchive.load(path).bitmap
+
+        raise FileNotFoundError(f'[MapBuilder][load] No \'{path}\' or .npy bitmap for \'{name}\'')
+
+    @INSTRUMENTS.timed('builder.parse')
+    def parse(name: str, bitmap: np.ndarray, *, inject=False, random=False, getvisible=False,
+              objects: Sequence[DuckieObject] = (), binary=False, workers=1,
+              progress: Optional[Callable[[float], None]] = None):
+        """
+        Parses bitmap and writes it file. `objects` (e.g. stamped by `scenery.SceneryStamper`)
+        are written after the signs and random objects. `progress` is called with the done
+        fraction between stages. With `binary` a MapArchive `.npz` is written next to the text map, with `workers` > 1
+        visibility is computed in parallel processes
+        """
         print(f'[MapBuilder] Parse \'{name}\'')
 
+        progress = progress or (lambda _: None)
+        bitmap = np.asarray(bitmap)
+
         duckie = MapBuilder._bitmap2duckie(bitmap)
+        progress(0.3)
         signs  = MapBuilder._duckie2signs(duckie)
+        progress(0.4)
         randomness = MapBuilder._generateRandomObjects((duckie.width, duckie.height)) if random else list()
+        randomness = list(randomness) + list(objects)
+        progress(0.5)
         # randomness = [DuckieObject('duckie', 0, 8+1., 1+0+0., 0.10),
         #             DuckieObject('duckie', 0, 8+0., 1+0+1., 0.10),
         #             DuckieObject('duckie', 0, 8+0.5, 1+0+0.5, 0.10)] \
@@ -248,15 +334,27 @@ class MapBuilder:
         #             DuckieObject('tree', 0, 8+0.5, 1+-1+0.5, 0.10)]
 
         if inject:
-            name = expanduser(f'{MapBuilder._MAPS_PATH}/{name}.yaml')
+            base = expanduser(f'{MapBuilder._MAPS_PATH}/{name}')
+            file_name = f'{base}.yaml'
         else:
-            name = f'{name}.txt'
+            base = name
+            file_name = f'{base}.txt'
+
+        MapBuilder._saveMap(file_name, duckie, signs, randomness)
+        if binary:
+            MapBuilder._saveBinary(f'{base}.npz', bitmap, duckie, signs, randomness,
+                                   name=name, tile_size=0.585, random=bool(random))
+        progress(0.6)
 
-        MapBuilder._saveMap(name, duckie, signs, randomness)
+        visible = MapBuilder._getMapOfVisibleObjects(bitmap, duckie, signs + randomness, workers) if getvisible else None
+        progress(1.0)
 
-        return MapBuilder._getMapOfVisibleObjects(bitmap, duckie, signs + randomness) if getvisible else None
+        return visible
 
 if __name__ == '__main__':
+    import cv2
+    from map_generator import MapGenerator
+
     # generated = MapGenerator.generate((5, 8), show_generation=True)
     generated = np.zeros((7,9), dtype=np.uint8)
     generated[0, 2:] = 255
@@ -0,0 +1,251 @@
+"""
+Local map service keeping tiles, imports and tile geometry warm between requests.
+
+    PYTHONPATH=src python src/map_daemon.py [--socket PATH | --port PORT] [--workers N]
+        [--root DIR] [--inputs DIR]
+
+Requests and responses are JSON objects, one per line. Every request has an
+`op` and an optional `id` which is echoed back, responses are written as
+soon as they are ready, so they may come out of order:
+
+    {"id": 1, "op": "generate", "width": 10, "height": 10, "seed": 3}
+    {"id": 1, "ok": true, "result": {"bitmap": [[...]]}}
+
+Ops: `ping`, `generate` (width, height, [seed], [out] .npy path instead of
+an inline bitmap), `parse` (name, bitmap or bitmap_path, [inject], [random],
+[binary], [seed]) and `export` (generate and parse in one step).
+
+Paths in requests are relative: `name` and `out` resolve under `--root`,
+`bitmap_path` under `--inputs` (the root by default). Requests escaping
+them are rejected, so clients can neither read nor write elsewhere.
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from os.path import expanduser, dirname
+from typing import Any, Optional
+import asyncio
+import json
+import os
+import socket
+import sys
+import numpy as np
+
+SOCKET_PATH = '~/.local/share/duckietown-mapbuilder/daemon.sock'
+MAPS_PATH = '~/.local/share/duckietown-mapbuilder/maps'
+
+# request parameters holding paths, True for outputs
+_PATHS = dict(name=True, out=True, bitmap_path=False)
+
+# worker process state, filled by _warm
+_TILES = None
+
+def _warm(tiles: 'TileSet') -> None:
+    """Process pool initializer: pays imports once per worker and keeps the daemon's tiles"""
+    global _TILES
+    import cv2
+    from map_builder import MapBuilder
+
+    _TILES = tiles
+    # touches the area cache and the topology of a small map
+    MapBuilder._getMapOfVisibleObjects(np.full((3, 3), 255, dtype=np.uint8),
+                                       MapBuilder._bitmap2duckie(np.full((3, 3), 255, dtype=np.uint8)), ())
+
+def _seed(seed: Optional[int]) -> None:
+    if seed is not None:
+        import random
+        random.seed(seed)
+        np.random.seed(seed)
+
+def _generate(width: int, height: int, seed: Optional[int] = None) -> np.ndarray:
+    from map_generator import MapGenerator
+
+    _seed(seed)
+    tiles = _TILES if _TILES is not None else MapGenerator._loadTiles()
+    for state in MapGenerator.iterate((width, height), tiles):
+        pass
+    bitmap = MapGenerator.stateToBitmap(state, tiles, (width, height))
+    return np.where(bitmap > 127, 255, 0).astype(np.uint8)
+
+def _parse(name: str, bitmap: np.ndarray, inject: bool = False, random: bool = False,
+           binary: bool = False, seed: Optional[int] = None) -> dict:
+    from map_builder import MapBuilder
+
+    _seed(seed)
+    MapBuilder.parse(name, bitmap, inject=inject, random=random, binary=binary)
+    return dict(name=name, shape=list(bitmap.shape))
+
+def do_generate(width: int, height: int, seed: Optional[int] = None, out: Optional[str] = None) -> dict:
+    bitmap = _generate(width, height, seed)
+    if out is None:
+        return dict(bitmap=bitmap.tolist())
+    np.save(out, bitmap)
+    return dict(out=out, shape=list(bitmap.shape))
+
+def do_parse(name: str, bitmap: Optional[list] = None, bitmap_path: Optional[str] = None,
+             inject: bool = False, random: bool = False, binary: bool = False,
+             seed: Optional[int] = None) -> dict:
+    if bitmap is not None:
+        array = np.asarray(bitmap, dtype=np.uint8)
+    elif bitmap_path is not None:
+        array = np.load(bitmap_path)
+    else:
+        raise KeyError('[MapDaemon][parse] Expected bitmap or bitmap_path')
+    return _parse(name, array, inject, random, binary, seed)
+
+def do_export(name: str, width: int, height: int, inject: bool = False, random: bool = False,
+              binary: bool = False, seed: Optional[int] = None) -> dict:
+    return _parse(name, _generate(width, height, seed), inject, random, binary, seed)
+
+_OPS = dict(generate=do_generate, parse=do_parse, export=do_export)
+
+
+class MapDaemon:
+    """
+    asyncio server dispatching requests to a warm process pool.
+
+    Connections are served concurrently and every request line becomes its
+    own task, so a slow generation does not block quick requests from the
+    same client.
+    """
+    def __init__(self, workers: int = 2, root: str = MAPS_PATH, inputs: Optional[str] = None):
+        from map_generator import MapGenerator
+
+        self._root = os.path.realpath(expanduser(root))
+        self._inputs = self._root if inputs is None else os.path.realpath(expanduser(inputs))
+        os.makedirs(self._root, exist_ok=True)
+        self._pool = ProcessPoolExecutor(workers, initializer=_warm, initargs=(MapGenerator._loadTiles(),))
+        self._served = 0
+
+    def _confine(self, params: dict) -> None:
+        """Resolves path parameters under their root, raises PermissionError for paths escaping it"""
+        for key, output in _PATHS.items():
+            if params.get(key) is None:
+                continue
+            root = self._root if output else self._inputs
+            path = os.path.realpath(os.path.join(root, str(params[key])))
+            if os.path.commonpath((root, path)) != root:
+                raise PermissionError(f'[MapDaemon] {key} \'{params[key]}\' is outside {root}')
+            if output:
+                os.makedirs(dirname(path), exist_ok=True)
+            params[key] = path
+
+    async def _handle(self, line: bytes, writer: asyncio.StreamWriter, lock: asyncio.Lock) -> None:
+        rid = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise TypeError(f'[MapDaemon] Expected a JSON object, got {type(request).__name__}')
+            rid = request.pop('id', None)
+            op = request.pop('op', None)
+
+            if op == 'ping':
+                result = dict(served=self._served)
+            elif op in _OPS:
+                self._confine(request)
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._pool, _call, op, request)
+            else:
+                raise KeyError(f'[MapDaemon] Unknown op \'{op}\'')
+            response = dict(id=rid, ok=True, result=result)
+        except Exception as e:
+            response = dict(id=rid, ok=False, error=f'{type(e).__name__}: {e}')
+
+        self._served += 1
+        async with lock:
+            writer.write((json.dumps(response) + '\n').encode())
+            await writer.drain()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(self._handle(line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    def _isAlive(path: str) -> bool:
+        """Whether something accepts connections on the unix socket, a stale file refuses them"""
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            return True
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+        finally:
+            probe.close()
+
+    async def run(self, path: Optional[str] = None, port: Optional[int] = None) -> None:
+        if port is not None:
+            server = await asyncio.start_server(self._serve, '127.0.0.1', port)
+            print(f'[MapDaemon] Listening on 127.0.0.1:{port}')
+        else:
+            path = expanduser(path or SOCKET_PATH)
+            os.makedirs(dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                if MapDaemon._isAlive(path):
+                    self._pool.shutdown()
+                    raise RuntimeError(f'[MapDaemon] Another daemon is listening on {path}')
+                os.remove(path)
+            server = await asyncio.start_unix_server(self._serve, path)
+            print(f'[MapDaemon] Listening on {path}')
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+            if port is None and os.path.exists(path):
+                os.remove(path)
+
+def _call(op: str, params: dict) -> Any:
+    return _OPS[op](**params)
+
+
+class MapClient:
+    """Blocking client for simulators, one request at a time"""
+    def __init__(self, path: Optional[str] = None, port: Optional[int] = None):
+        if port is not None:
+            self._socket = socket.create_connection(('127.0.0.1', port))
+        else:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(expanduser(path or SOCKET_PATH))
+        self._file = self._socket.makefile('rwb')
+        self._ids = 0
+
+    def request(self, op: str, **params) -> Any:
+        self._ids += 1
+        self._file.write((json.dumps(dict(params, id=self._ids, op=op)) + '\n').encode())
+        self._file.flush()
+        response = json.loads(self._file.readline())
+        if not response['ok']:
+            raise Exception(f'[MapClient][{op}] {response["error"]}')
+        return response['result']
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+
+def main(argv: list[str] = None) -> None:
+    parser = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--socket', help=f'unix socket path, default {SOCKET_PATH}')
+    parser.add_argument('--port', type=int, help='listen on localhost TCP instead')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--root', default=MAPS_PATH, help=f'directory for written maps, default {MAPS_PATH}')
+    parser.add_argument('--inputs', help='directory bitmap_path is read from, default the root')
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(MapDaemon(args.workers, args.root, args.inputs).run(args.socket, args.port))
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -2,15 +2,19 @@
 
 import random
 from collections import namedtuple
+from typing import Iterator, Optional
 import numpy as np
-from PIL import Image
-from tileproc.tile_processing import TILES_PATH, Tile, get_tiles, state2image
-from utills import Direction
-import cv2
+from tileproc.tile_processing import TILES_PATH, get_tiles, state2image, state2array
+from tileproc.tile_compiler import TileSet
+from utills import Direction, GridTopology
+from instrument import INSTRUMENTS
+from map_hash import DedupeIndex
 import os
 
 class MapGenerator:
     def _show_view(state: np.ndarray, window_size: tuple[int, int] = (480, 480)) -> None:
+        import cv2
+
         view = np.array(state)
         height, width = view.shape[:2]
         scale = min(window_size[0]//width, window_size[1]//height)
@@ -34,46 +38,43 @@ class MapGenerator:
             return None
         
         return location
-    def _addConstraint(tiles: list[Tile],
+    def _addConstraint(compatible: np.ndarray,
                     state:              np.ndarray, 
                     location:           tuple[int, int], 
                     incoming_direction: Direction, 
-                    possible_tiles:     list[Tile]) -> bool:
-        neighbor_constraint = {t.sides[incoming_direction.value] for t in possible_tiles}
-        outgoing_direction = incoming_direction.reverse()
-        changed = False
-
-        for i, not_used in enumerate(state[location]):
-            if not not_used:
-                continue
-            if tiles[i].sides[outgoing_direction.value] not in neighbor_constraint:
-                state[location][i] = False
-                changed = True
+                    possible_tiles:     np.ndarray) -> bool:
+        allowed = np.any(compatible[incoming_direction.value][possible_tiles], axis=0)
+        remaining = state[location] & allowed
+        changed = bool(np.any(remaining != state[location]))
+        state[location] = remaining
         
-        if not np.any(state[location]):
+        if not np.any(remaining):
             raise Exception(f"No patterns left at {location}")
         
         return changed
-    def _propagate(tiles: list[Tile], state: np.ndarray, start_location: tuple[int, int]):
+    def _propagate(compatible: np.ndarray, state: np.ndarray, start_location: tuple[int, int]):
         height, width = state.shape[:2]
-        needs_update = np.full((height, width), False)
-        needs_update[start_location] = True
+        neighbors = GridTopology.of(height, width).neighbors
+        needs_update = np.full(height * width, False)
+        needs_update[start_location[0] * width + start_location[1]] = True
 
         while np.any(needs_update):
-            needs_update_next = np.full((height, width), False)
-            locations = MapGenerator._nonzero(needs_update)
-            
-            for location in locations:
-                possible_tiles = [tiles[n] for n in MapGenerator._nonzero(state[location])]
-            
-                for direction, x, y in Direction.neighbors(location, height, width):
-                    location = (x, y)
-                    was_updated = MapGenerator._addConstraint(tiles, state, location,
+            needs_update_next = np.full(height * width, False)
+
+            for cell in np.flatnonzero(needs_update):
+                possible_tiles = state[divmod(cell, width)].copy()
+
+                for direction in Direction:
+                    neighbor = neighbors[direction.value, cell]
+                    if neighbor == GridTopology.NONE:
+                        continue
+                    was_updated = MapGenerator._addConstraint(compatible, state, divmod(neighbor, width),
                                                 direction, possible_tiles)
-                    needs_update_next[location] |= was_updated
-            
+                    needs_update_next[neighbor] |= was_updated
+
             needs_update = needs_update_next
-    def _nextIteration(tiles: list[Tile], weights: list[float], old_state: np.ndarray) -> np.ndarray:
+    @INSTRUMENTS.timed('generator.nextIteration')
+    def _nextIteration(compatible: np.ndarray, weights: list[float], old_state: np.ndarray) -> np.ndarray:
         state = old_state.copy()
         to_collapse = MapGenerator._minEntropyLocation(state)
         
@@ -90,10 +91,12 @@ class MapGenerator:
             state[to_collapse] = False
             state[to_collapse][selected_tile] = True
 
-            MapGenerator._propagate(tiles, state, to_collapse)
+            MapGenerator._propagate(compatible, state, to_collapse)
         
         return state
     def _tilemap2bitmap(last_state: np.ndarray) -> np.ndarray:
+        import cv2
+
         end_state = last_state
         end_state = np.concatenate((
             [end_state[0,:]], 
@@ -108,40 +111,66 @@ class MapGenerator:
 
         return cv2.resize(end_state, (w//2, h//2))
 
-    def generate(size: tuple[int, int] = (10, 10), show_generation: bool = False):
-        width, height = size
-        width_pad  = width  % 2
-        height_pad = height % 2
-        width  //= 2
-        height //= 2
-        
-        tiles = list()
+    def _loadTiles() -> TileSet:
         try:
-            tiles = get_tiles()
+            return get_tiles()
         except FileNotFoundError as e:
-            os.mkdir('resources', 0o777)
-            os.mkdir(TILES_PATH, 0o777)
+            os.makedirs(TILES_PATH, 0o777, exist_ok=True)
             from tileproc.generate_tiles import generate_tiles
             
             generate_tiles()
-            tiles = get_tiles()
-
-        weights = np.asarray([tile.weight for tile in tiles])
+            return get_tiles()
+
+    def iterate(size: tuple[int, int] = (10, 10), tiles: TileSet = None) -> Iterator[np.ndarray]:
+        """
+        Resumable generation: yields the WFC state (cells x tiles possibility mask)
+        after every collapsed cell, starting with the initial state.
+        Use `stateToBitmap` to turn any yielded state into a (preview) bitmap.
+        """
+        width, height = size
+        tiles = MapGenerator._loadTiles() if tiles is None else tiles
+        weights = np.asarray(tiles.weights)
+        compatible = tiles.compatible
 
-        state = np.full((width, height, len(tiles)), True)
+        state = np.full((width // 2, height // 2, len(tiles)), True)
+        yield state
 
-        cur_state = state
         while True:
-            if show_generation:
-                MapGenerator._show_view(state2image(cur_state, tiles))
-            
             try:
-                cur_state = MapGenerator._nextIteration(tiles, weights, cur_state)
+                state = MapGenerator._nextIteration(compatible, weights, state)
             except StopIteration as e:
-                break
+                return
             except Exception as e:
                 print(e)
-                break
+                return
+            yield state
+
+    def stateToBitmap(state: np.ndarray, tiles: TileSet, size: tuple[int, int]) -> np.ndarray:
+        """Bitmap of `size` for a WFC state, undecided cells are blends of their candidates"""
+        width, height = size
+        bitmap = MapGenerator._tilemap2bitmap(state2array(state, tiles))
+        return bitmap[:width//2*2 + width%2, :height//2*2 + height%2]
+
+    def collapsedFraction(state: np.ndarray) -> float:
+        return float(np.mean(np.sum(state, axis=2) == 1))
+
+    @INSTRUMENTS.timed('generator.generate')
+    def generate(size: tuple[int, int] = (10, 10), show_generation: bool = False):
+        import cv2
+        from PIL import Image
+
+        width, height = size
+        width_pad  = width  % 2
+        height_pad = height % 2
+        width  //= 2
+        height //= 2
+        
+        tile_set = MapGenerator._loadTiles()
+        tiles = tile_set.toTiles()
+
+        for cur_state in MapGenerator.iterate(size, tile_set):
+            if show_generation:
+                MapGenerator._show_view(state2image(cur_state, tiles))
 
         if show_generation:
             MapGenerator._show_view(state2image(cur_state, tiles))
@@ -154,9 +183,41 @@ class MapGenerator:
 
         Image.fromarray(final_map).save("resources/map.png")
 
-        cv2.destroyAllWindows()
+        if show_generation:
+            cv2.destroyAllWindows()
 
         return final_map
 
+    def generateBatch(count: int, size: tuple[int, int] = (10, 10), *,
+                      index: Optional[DedupeIndex] = None,
+                      max_attempts: Optional[int] = None) -> Iterator[np.ndarray]:
+        """
+        Yields up to `count` fully collapsed bitmaps, skipping maps that are rotations
+        or reflections of already seen ones. Pass a shared `index` to dedupe across batches.
+        Stops after `max_attempts` generations (10 per map by default) for sizes with few distinct maps.
+        """
+        index = DedupeIndex() if index is None else index
+        max_attempts = 10 * count if max_attempts is None else max_attempts
+        tiles = MapGenerator._loadTiles()
+
+        produced = skipped = 0
+        for _ in range(max_attempts):
+            if produced == count:
+                break
+            for state in MapGenerator.iterate(size, tiles):
+                pass
+            if MapGenerator.collapsedFraction(state) < 1.0:
+                continue
+
+            bitmap = MapGenerator.stateToBitmap(state, tiles, size)
+            if not index.add(bitmap):
+                skipped += 1
+                continue
+
+            produced += 1
+            yield bitmap
+
+        print(f'[MapGenerator][generateBatch] {produced} maps, {skipped} duplicates skipped')
+
 if __name__ == '__main__':
     generated = MapGenerator.generate((7, 2), show_generation=True)
\ No newline at end of file
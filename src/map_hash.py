@@ -0,0 +1,82 @@
+from hashlib import blake2b
+from threading import Lock
+from typing import Iterable, Union
+import numpy as np
+
+from utills import DuckieMap
+
+MapSource = Union[np.ndarray, DuckieMap]
+
+def road_mask(source: MapSource) -> np.ndarray:
+    """
+    Road cells of a bitmap or of a DuckieMap, tile names follow from the mask.
+    Isolated road pixels become floor tiles, so only their bitmap keeps them
+    """
+    if isinstance(source, DuckieMap):
+        return np.array([[tile != 'floor' for tile in row] for row in source.tiles], dtype=bool) \
+            .reshape(source.width, source.height)
+    return np.asarray(source) != 0
+
+def canonical_form(source: MapSource) -> tuple[tuple[int, int], bytes]:
+    """
+    Smallest packed road mask among the 8 rotations and reflections of the map.
+
+    Only variants in the canonical orientation (fewer rows than columns) are
+    compared, they are stacked and packed together and the minimum is found
+    with one lexsort.
+    """
+    mask = road_mask(source)
+    variants = [np.rot90(mask, k) for k in range(4)]
+    variants += [np.rot90(mask.T, k) for k in range(4)]
+
+    shape = min(mask.shape), max(mask.shape)
+    stack = np.array([variant for variant in variants if variant.shape == shape])
+    packed = np.packbits(stack.reshape(len(stack), -1), axis=1)
+
+    if packed.shape[1] == 0:
+        return shape, b''
+    smallest = np.lexsort(packed.T[::-1])[0]
+    return shape, packed[smallest].tobytes()
+
+def fingerprint(source: MapSource) -> str:
+    """Hex digest equal for maps that are rotations or reflections of each other"""
+    shape, packed = canonical_form(source)
+    digest = blake2b(digest_size=16)
+    digest.update(np.array(shape, dtype='<u4').tobytes())
+    digest.update(packed)
+    return digest.hexdigest()
+
+
+class DedupeIndex:
+    """Set of map fingerprints, optionally kept in a text file with one fingerprint per line"""
+    def __init__(self, fingerprints: Iterable[str] = ()):
+        self._seen = set(fingerprints)
+        self._lock = Lock()
+
+    def load(path: str) -> 'DedupeIndex':
+        with open(path) as index:
+            return DedupeIndex(line.strip() for line in index if line.strip())
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            seen = sorted(self._seen)
+        with open(path, 'w') as index:
+            index.writelines(f'{key}\n' for key in seen)
+
+    def add(self, source: MapSource) -> bool:
+        """Records the map, False if an equivalent map was already seen"""
+        key = fingerprint(source)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            return True
+
+    def __contains__(self, source: MapSource) -> bool:
+        key = fingerprint(source)
+        with self._lock:
+            return key in self._seen
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._seen)
@@ -0,0 +1,173 @@
+from typing import Any, Callable, Optional
+import numpy as np
+
+from model.region import Region
+
+class ChunkedBitmap:
+    """
+    Sparse 2D bitmap made of fixed-size square chunks.
+
+    A chunk is allocated on the first write of a non-zero value and released
+    when it becomes all zero again, so memory scales with the painted area.
+    Supports the subset of the ndarray interface used by MapData and the
+    journal: `shape`, `dtype`, region/cell indexing and `np.asarray`.
+    """
+    def __init__(self, shape: tuple[int, int], dtype=np.uint8, chunk: int = 64):
+        self.shape = tuple(shape[:2])
+        self.dtype = np.dtype(dtype)
+        self.chunk = chunk
+        self._loaded: dict[tuple[int, int], np.ndarray] = dict()
+        self._loader: Optional[Callable[[], dict]] = None
+        self._zero = np.zeros((chunk, chunk), dtype=self.dtype)
+        self._zero.setflags(write=False)
+
+    def fromArray(array: np.ndarray, chunk: int = 64) -> 'ChunkedBitmap':
+        array = np.asarray(array)
+        res = ChunkedBitmap(array.shape[:2], array.dtype, chunk)
+        res[:, :] = array
+        return res
+
+    def lazy(shape: tuple[int, int], dtype, chunk: int,
+             loader: Callable[[], dict[tuple[int, int], np.ndarray]]) -> 'ChunkedBitmap':
+        """Bitmap whose chunks are read by `loader` on first access"""
+        res = ChunkedBitmap(shape, dtype, chunk)
+        res._loader = loader
+        return res
+
+    @property
+    def _chunks(self) -> dict[tuple[int, int], np.ndarray]:
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            self._loaded = loader()
+        return self._loaded
+
+    @_chunks.setter
+    def _chunks(self, chunks: dict[tuple[int, int], np.ndarray]) -> None:
+        self._loader = None
+        self._loaded = chunks
+
+    def isLoaded(self) -> bool:
+        return self._loader is None
+
+    @property
+    def ndim(self) -> int:
+        return 2
+
+    @property
+    def size(self) -> int:
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by allocated chunks"""
+        return len(self._chunks) * self._zero.nbytes
+
+    def chunkCount(self) -> int:
+        return len(self._chunks)
+
+    def _chunkRange(self, region: Region):
+        c = self.chunk
+        for ci in range(region.x_min // c, (region.x_max - 1) // c + 1):
+            for cj in range(region.y_min // c, (region.y_max - 1) // c + 1):
+                bounds = Region(ci*c, cj*c, ci*c + c, cj*c + c).intersection(region)
+                yield (ci, cj), bounds
+
+    def _axis(self, key, n: int) -> tuple[int, int, bool]:
+        """Bounds of a one-axis index and whether the axis is dropped"""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(n)
+            if step != 1:
+                raise IndexError("[ChunkedBitmap] Only unit step slices are supported")
+            return start, max(start, stop), False
+
+        index = int(key)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError(f"[ChunkedBitmap] Index {key} is out of bounds for size {n}")
+        return index, index + 1, True
+
+    def _region(self, key) -> tuple[Region, tuple[bool, bool]]:
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            raise IndexError(f"[ChunkedBitmap] Expected 2 indices, got {len(key)}")
+
+        x_min, x_max, drop_x = self._axis(key[0], self.shape[0])
+        y_min, y_max, drop_y = self._axis(key[1], self.shape[1])
+
+        return Region(x_min, y_min, x_max, y_max), (drop_x, drop_y)
+
+    def _squeeze(self, block: np.ndarray, drop: tuple[bool, bool]):
+        if drop == (True, True):
+            return block[0, 0]
+        if drop[0]:
+            return block[0]
+        if drop[1]:
+            return block[:, 0]
+        return block
+
+    def getRegion(self, region: Region) -> np.ndarray:
+        out = np.zeros(region.shape, dtype=self.dtype)
+        if region.isEmpty():
+            return out
+
+        for key, bounds in self._chunkRange(region):
+            chunk = self._chunks.get(key)
+            if chunk is None:
+                continue
+            out[bounds.x_min - region.x_min:bounds.x_max - region.x_min,
+                bounds.y_min - region.y_min:bounds.y_max - region.y_min] = \
+                chunk[bounds.x_min % self.chunk:(bounds.x_min % self.chunk) + bounds.shape[0],
+                      bounds.y_min % self.chunk:(bounds.y_min % self.chunk) + bounds.shape[1]]
+        return out
+
+    def setRegion(self, region: Region, value: Any) -> None:
+        if region.isEmpty():
+            return
+        value = np.broadcast_to(np.asarray(value, dtype=self.dtype), region.shape)
+
+        for key, bounds in self._chunkRange(region):
+            part = value[bounds.x_min - region.x_min:bounds.x_max - region.x_min,
+                         bounds.y_min - region.y_min:bounds.y_max - region.y_min]
+            chunk = self._chunks.get(key)
+            if chunk is None:
+                if not np.any(part):
+                    continue
+                chunk = self._chunks[key] = self._zero.copy()
+
+            x, y = bounds.x_min % self.chunk, bounds.y_min % self.chunk
+            chunk[x:x + bounds.shape[0], y:y + bounds.shape[1]] = part
+
+            if not np.any(chunk):
+                del self._chunks[key]
+
+    def __getitem__(self, key):
+        region, drop = self._region(key)
+        if drop == (True, True):
+            x, y = region.x_min, region.y_min
+            chunk = self._chunks.get((x // self.chunk, y // self.chunk), self._zero)
+            return chunk[x % self.chunk, y % self.chunk]
+        return self._squeeze(self.getRegion(region), drop)
+
+    def __setitem__(self, key, value) -> None:
+        region, drop = self._region(key)
+        value = np.asarray(value, dtype=self.dtype)
+        if drop[0] and value.ndim == 1:
+            value = value[None, :]
+        elif drop[1] and value.ndim == 1:
+            value = value[:, None]
+        self.setRegion(region, value)
+
+    def __array__(self, dtype=None, copy: Optional[bool] = None) -> np.ndarray:
+        res = self.getRegion(Region.ofSize(self.shape))
+        return res if dtype is None else res.astype(dtype, copy=False)
+
+    def copy(self) -> 'ChunkedBitmap':
+        res = ChunkedBitmap(self.shape, self.dtype, self.chunk)
+        res._chunks = {key: chunk.copy() for key, chunk in self._chunks.items()}
+        return res
+
+    def chunks(self) -> dict[tuple[int, int], np.ndarray]:
+        """Allocated chunks by chunk coordinates, for persistence"""
+        return self._chunks
@@ -0,0 +1,53 @@
+from threading import Lock
+from typing import Optional
+
+from model.region import Region
+
+class DirtyQueue:
+    """
+    Accumulates changed regions of one model between two `drain` calls.
+
+    Overlapping and touching rectangles are merged on push, and once more
+    than `max_rects` are pending they collapse into their bounding box, so
+    consumers get a short list of rectangles whatever the edit rate.
+    Can be passed directly as a listener to `MapData.subscribe`.
+    """
+    def __init__(self, max_rects: int = 16):
+        self.max_rects = max_rects
+        self.version = 0
+        self._rects: list[Region] = []
+        self._lock = Lock()
+
+    def _touching(a: Region, b: Region) -> bool:
+        return a.x_min <= b.x_max and b.x_min <= a.x_max \
+            and a.y_min <= b.y_max and b.y_min <= a.y_max
+
+    def push(self, region: Optional[Region], version: int = 0) -> None:
+        if region is None:
+            return
+
+        with self._lock:
+            self.version = max(self.version, version)
+            merged = True
+            while merged:
+                merged = False
+                for i, rect in enumerate(self._rects):
+                    if DirtyQueue._touching(rect, region):
+                        region = region.union(self._rects.pop(i))
+                        merged = True
+                        break
+            self._rects.append(region)
+
+            if len(self._rects) > self.max_rects:
+                bounds = self._rects[0]
+                for rect in self._rects[1:]:
+                    bounds = bounds.union(rect)
+                self._rects = [bounds]
+
+    def isDirty(self) -> bool:
+        return len(self._rects) > 0
+
+    def drain(self) -> list[Region]:
+        with self._lock:
+            rects, self._rects = self._rects, []
+        return rects
@@ -0,0 +1,127 @@
+from dataclasses import dataclass
+from time import monotonic
+from typing import Optional
+import numpy as np
+
+from model.region import Region
+
+@dataclass(init=True, repr=True, eq=False, frozen=True)
+class _Diff:
+    """Changed cells of `region`: flat indices inside the region block with old and new values"""
+    region: Region
+    index: np.ndarray
+    old: np.ndarray
+    new: np.ndarray
+    stamp: float
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes + self.old.nbytes + self.new.nbytes
+
+    def _globalIndex(self, region: Region) -> np.ndarray:
+        """Flat indices of this diff inside another (enclosing) region"""
+        x, y = np.divmod(self.index, self.region.shape[1])
+        return np.ravel_multi_index((x + self.region.x_min - region.x_min,
+                                     y + self.region.y_min - region.y_min), region.shape)
+
+    def merge(self, later: '_Diff') -> Optional['_Diff']:
+        """Single diff equivalent to applying `self` and then `later`"""
+        region = self.region.union(later.region)
+        index = np.concatenate((self._globalIndex(region), later._globalIndex(region)))
+        old   = np.concatenate((self.old, later.old))
+        new   = np.concatenate((self.new, later.new))
+
+        merged, first = np.unique(index, return_index=True)
+        _, last = np.unique(index[::-1], return_index=True)
+        old = old[first]
+        new = new[::-1][last]
+
+        changed = old != new
+        if not np.any(changed):
+            return None
+
+        return _Diff.of(region, merged[changed], old[changed], new[changed], later.stamp)
+
+    def of(region: Region, index: np.ndarray, old: np.ndarray, new: np.ndarray, stamp: float) -> '_Diff':
+        dtype = np.uint32 if region.area < 2**32 else np.int64
+        return _Diff(region, np.asarray(index, dtype=dtype), np.asarray(old), np.asarray(new), stamp)
+
+
+class EditJournal:
+    """
+    Undo/redo history of bitmap edits.
+
+    Only changed cells are stored, so memory grows with the size of the edits,
+    not with the size of the map. Edits recorded within `coalesce_window`
+    seconds of each other are merged into a single undo step.
+    """
+    def __init__(self, coalesce_window: float = 0.5, limit: int = 1000):
+        self.coalesce_window = coalesce_window
+        self.limit = limit
+        self._undo: list[_Diff] = []
+        self._redo: list[_Diff] = []
+        self._sealed = True
+
+    def record(self, region: Region, index: np.ndarray, old: np.ndarray, new: np.ndarray,
+               *, stamp: Optional[float] = None) -> None:
+        stamp = monotonic() if stamp is None else stamp
+        diff = _Diff.of(region, index, old, new, stamp)
+        self._redo.clear()
+
+        if not self._sealed and self._undo \
+                and stamp - self._undo[-1].stamp <= self.coalesce_window:
+            merged = self._undo.pop().merge(diff)
+            if merged is None:
+                # the step cancelled out, the entry below it was sealed when the step began
+                self._sealed = True
+                return
+            self._undo.append(merged)
+        else:
+            self._undo.append(diff)
+            if len(self._undo) > self.limit:
+                del self._undo[0]
+
+        self._sealed = False
+
+    def seal(self) -> None:
+        """Forces the next recorded edit into a new undo step"""
+        self._sealed = True
+
+    def _apply(bitmap, diff: _Diff, values: np.ndarray) -> Region:
+        block = np.array(bitmap[diff.region.slices])
+        block.flat[diff.index] = values
+        bitmap[diff.region.slices] = block
+        return diff.region
+
+    def undo(self, bitmap) -> Optional[Region]:
+        """Reverts the last edit step in `bitmap`, returns the changed region"""
+        if not self._undo:
+            return None
+        diff = self._undo.pop()
+        self._redo.append(diff)
+        self._sealed = True
+        return EditJournal._apply(bitmap, diff, diff.old)
+
+    def redo(self, bitmap) -> Optional[Region]:
+        """Reapplies the last undone edit step in `bitmap`, returns the changed region"""
+        if not self._redo:
+            return None
+        diff = self._redo.pop()
+        self._undo.append(diff)
+        self._sealed = True
+        return EditJournal._apply(bitmap, diff, diff.new)
+
+    def canUndo(self) -> bool:
+        return len(self._undo) > 0
+
+    def canRedo(self) -> bool:
+        return len(self._redo) > 0
+
+    def clear(self) -> None:
+        self._undo.clear()
+        self._redo.clear()
+        self._sealed = True
+
+    @property
+    def nbytes(self) -> int:
+        return sum(diff.nbytes for diff in self._undo) + sum(diff.nbytes for diff in self._redo)
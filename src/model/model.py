@@ -1,7 +1,13 @@
 from dataclasses import dataclass, field
-from typing import Any, Optional, Protocol
+from itertools import count
+from threading import RLock
+from typing import Any, Callable, Optional, Protocol
 import numpy as np
 
+from model.chunked import ChunkedBitmap
+from model.journal import EditJournal
+from model.region import Region
+
 class ButtonPad(Protocol):
     def buttonOnClick(self, x, y) -> None:
         ...
@@ -15,54 +21,286 @@ class ButtonPad(Protocol):
     def getSize(self) -> tuple[int, int]:
         ...
 
+    def getRegion(self, region: Region) -> np.ndarray:
+        ...
+
+Listener = Callable[[Optional[Region], int], None]
+
+# process-wide, so a map recreated under an old name never reuses a token
+_TOKENS = count()
+
 class MapData:
+    # half size of the first flood fill window
+    FILL_REACH = 64
+
     def __init__(self, 
             name: str, 
             size: Optional[tuple[int, int]] = (10, 10),
             bitmap: Optional[np.ndarray] = None,
-            inject: bool = False):
+            inject: bool = False,
+            journal: Optional[EditJournal] = None,
+            sparse: bool = False):
         self.name = name
-        self.bitmap = np.zeros(size, dtype=np.uint8) if bitmap is None else bitmap
+        if bitmap is None:
+            bitmap = ChunkedBitmap(size) if sparse else np.zeros(size, dtype=np.uint8)
+        self.bitmap = bitmap
         self.inject = inject
+        self.journal = EditJournal() if journal is None else journal
+        self.version = 0
+        self.token = next(_TOKENS)
+        # held by every edit, so background readers such as autosave see whole edits only
+        self.lock = RLock()
+        self._listeners: list[Listener] = []
+
+    def subscribe(self, listener: Listener) -> Callable[[], None]:
+        """Calls `listener(region, version)` after every change, returns an unsubscribe function"""
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    def _touch(self, region: Optional[Region]) -> Optional[Region]:
+        """Marks `region` as changed and notifies listeners"""
+        if region is not None:
+            self.version += 1
+            for listener in tuple(self._listeners):
+                listener(region, self.version)
+        return region
+
+    def markDirty(self, region: Optional[Region] = None) -> None:
+        """Notifies listeners about changes made to `bitmap` directly, whole map by default"""
+        self._touch(Region.ofSize(self.getSize()) if region is None else region)
+
+    def _commit(self, region: Region, block: np.ndarray, record: bool = True) -> Optional[Region]:
+        """Writes `block` into `region`, records the change and returns the changed region"""
+        with self.lock:
+            return self._commitLocked(region, block, record)
+
+    def _commitLocked(self, region: Region, block: np.ndarray, record: bool) -> Optional[Region]:
+        old = self.bitmap[region.slices]
+        changed = old != block
+        if not np.any(changed):
+            return None
+
+        xs, ys = np.nonzero(changed)
+        inner = Region(int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+        dirty = Region(region.x_min + inner.x_min, region.y_min + inner.y_min,
+                       region.x_min + inner.x_max, region.y_min + inner.y_max)
+
+        index = np.flatnonzero(changed[inner.slices])
+        old   = np.array(old[inner.slices]).ravel()[index]
+        new   = np.asarray(block)[inner.slices].ravel()[index]
+
+        self.bitmap[region.slices] = block
+        if record:
+            self.journal.record(dirty, index, old, new)
+
+        return self._touch(dirty)
+
+    def _clip(self, region: Region) -> Optional[Region]:
+        return region.intersection(Region.ofSize(self.getSize()))
+
+    def _commitMask(self, region: Optional[Region], mask: np.ndarray, value: int) -> Optional[Region]:
+        """Sets every cell of `region` selected by `mask` to `value`"""
+        if region is None:
+            return None
+        with self.lock:
+            block = np.array(self.bitmap[region.slices])
+            block[mask] = value
+            return self._commit(region, block)
+
+    def setRegion(self, region: Region, block: np.ndarray, *, record: bool = True) -> Optional[Region]:
+        """Replaces a region of cells, `record=False` keeps the write out of the undo history"""
+        return self._commit(region, block, record)
 
     def buttonOnClick(self, x, y):
-        print(f'[MapData][\'{self.name}\']({x=} {y=}) onClick')
-        self.bitmap[x][y] ^= 255
+        region = Region.ofCell(x, y)
+        with self.lock:
+            self._commit(region, self.bitmap[region.slices] ^ 255)
+
+    def fillRect(self, region: Region, value: int = 255) -> Optional[Region]:
+        """Fills a rectangle of cells, returns the changed region"""
+        region = self._clip(region)
+        if region is None:
+            return None
+        return self._commit(region, np.full(region.shape, value, dtype=self.bitmap.dtype))
+
+    def drawLine(self, start: tuple[int, int], end: tuple[int, int], value: int = 255) -> Optional[Region]:
+        """Draws a 4-connected line of cells, so the result is a drivable road"""
+        (x0, y0), (x1, y1) = start, end
+        n = max(abs(x1 - x0), abs(y1 - y0)) + 1
+        xs = np.rint(np.linspace(x0, x1, n)).astype(np.int64)
+        ys = np.rint(np.linspace(y0, y1, n)).astype(np.int64)
+        # diagonal steps get a corner cell, otherwise the road would break apart
+        xs = np.concatenate((xs, xs[1:]))
+        ys = np.concatenate((ys, ys[:-1]))
+
+        region = self._clip(Region(min(x0, x1), min(y0, y1), max(x0, x1) + 1, max(y0, y1) + 1))
+        if region is None:
+            return None
+        inside = (region.x_min <= xs) & (xs < region.x_max) & (region.y_min <= ys) & (ys < region.y_max)
+
+        mask = np.zeros(region.shape, dtype=bool)
+        mask[xs[inside] - region.x_min, ys[inside] - region.y_min] = True
+        return self._commitMask(region, mask, value)
+
+    def brush(self, points: list[tuple[int, int]], radius: float = 1.0, value: int = 255) -> Optional[Region]:
+        """Paints every cell within `radius` of the stroke going through `points`"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        starts = points[:-1] if len(points) > 1 else points
+        ends   = points[1:]  if len(points) > 1 else points
+
+        low, high = points.min(axis=0) - radius, points.max(axis=0) + radius
+        region = self._clip(Region(int(np.floor(low[0])), int(np.floor(low[1])),
+                                   int(np.ceil(high[0])) + 1, int(np.ceil(high[1])) + 1))
+        if region is None:
+            return None
+
+        # every segment is rasterized inside its own padded box, the stroke is their union
+        mask = np.zeros(region.shape, dtype=bool)
+        for start, end in zip(starts, ends):
+            box = self._clip(Region(int(np.floor(min(start[0], end[0]) - radius)),
+                                    int(np.floor(min(start[1], end[1]) - radius)),
+                                    int(np.ceil(max(start[0], end[0]) + radius)) + 1,
+                                    int(np.ceil(max(start[1], end[1]) + radius)) + 1))
+            if box is None:
+                continue
+
+            gx, gy = np.ogrid[box.x_min:box.x_max, box.y_min:box.y_max]
+            segment = end - start
+            length2 = max(float(np.sum(segment**2)), 1e-12)
+            t = np.clip(((gx - start[0]) * segment[0] + (gy - start[1]) * segment[1]) / length2, 0.0, 1.0)
+            inside = (gx - start[0] - t * segment[0])**2 + (gy - start[1] - t * segment[1])**2 <= radius**2
+            mask[box.x_min - region.x_min:box.x_max - region.x_min,
+                 box.y_min - region.y_min:box.y_max - region.y_min] |= inside
+
+        return self._commitMask(region, mask, value)
+
+    def floodFill(self, x: int, y: int, value: int = 255) -> Optional[Region]:
+        """
+        Fills the 4-connected area of cells equal to cell (x, y).
+
+        The fill runs on a window around the seed which grows towards every
+        side the fill reaches, so small areas of big or sparse maps never
+        read the whole bitmap.
+        """
+        import cv2
+
+        x, y = int(x), int(y)
+        reach = MapData.FILL_REACH
+        with self.lock:
+            if self.bitmap[x, y] == value:
+                return None
+
+            h, w = self.getSize()
+            window = self._clip(Region(x - reach, y - reach, x + reach + 1, y + reach + 1))
+            while True:
+                image = np.ascontiguousarray(self.bitmap[window.slices], dtype=np.uint8)
+                mask = np.zeros((image.shape[0] + 2, image.shape[1] + 2), dtype=np.uint8)
+                cv2.floodFill(image, mask, (y - window.y_min, x - window.x_min), 0, 0, 0,
+                              4 | cv2.FLOODFILL_MASK_ONLY | (1 << 8))
+                mask = mask[1:-1, 1:-1].astype(bool)
+
+                # sides touched by the fill, unless they are map borders
+                top    = window.x_min > 0 and bool(mask[0].any())
+                left   = window.y_min > 0 and bool(mask[:, 0].any())
+                bottom = window.x_max < h and bool(mask[-1].any())
+                right  = window.y_max < w and bool(mask[:, -1].any())
+                if not (top or left or bottom or right):
+                    break
+                rows, cols = window.shape
+                window = self._clip(Region(window.x_min - top * rows, window.y_min - left * cols,
+                                           window.x_max + bottom * rows, window.y_max + right * cols))
+
+            xs, ys = np.nonzero(mask)
+            region = Region(int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+            mask = mask[region.slices]
+            region = Region(window.x_min + region.x_min, window.y_min + region.y_min,
+                            window.x_min + region.x_max, window.y_min + region.y_max)
+            return self._commitMask(region, mask, value)
+
+    def undo(self) -> Optional[Region]:
+        with self.lock:
+            return self._touch(self.journal.undo(self.bitmap))
+
+    def redo(self) -> Optional[Region]:
+        with self.lock:
+            return self._touch(self.journal.redo(self.bitmap))
 
     def getValue(self, x, y):
-        return self.bitmap[x][y]
+        return self.bitmap[x, y]
+
+    def getRegion(self, region: Region) -> np.ndarray:
+        return np.array(self.bitmap[region.slices])
 
     def value2color(self, arg: int) -> tuple[float, float, float]:
         return (arg/255,) * 3
 
     def getSize(self):
-        return self.bitmap.shape[:2]
+        return tuple(self.bitmap.shape[:2])
+
+StockListener = Callable[[str, Optional[Region], int], None]
 
 @dataclass
 class DataStock:
     models: dict[str, ButtonPad] = field(default_factory=dict)
+    _listeners: list[StockListener] = field(default_factory=list, init=False, repr=False)
+    _unsubscribe: dict[str, Callable[[], None]] = field(default_factory=dict, init=False, repr=False)
+    _lock: RLock = field(default_factory=RLock, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        for name, butt_pad in self.models.items():
+            self._watch(name, butt_pad)
+
+    def subscribe(self, listener: StockListener) -> Callable[[], None]:
+        """
+        Calls `listener(name, region, version)` whenever a model changes.
+        Adding a model reports its whole area, deleting it reports None.
+        """
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    def _publish(self, name: str, region: Optional[Region], version: int) -> None:
+        for listener in tuple(self._listeners):
+            listener(name, region, version)
+
+    def _watch(self, name: str, butt_pad: ButtonPad) -> None:
+        if hasattr(butt_pad, 'subscribe'):
+            self._unsubscribe[name] = butt_pad.subscribe(
+                lambda region, version: self._publish(name, region, version))
 
     def addData(self, name: str, butt_pad: ButtonPad) -> None:
         print(f'[Stock][addData] {name=}')
-        if name in self.models:
-            raise KeyError(f"[Stock][addData] Data with name \'{name}\' already exists")
-        
-        self.models[name] = butt_pad
+        with self._lock:
+            if name in self.models:
+                raise KeyError(f"[Stock][addData] Data with name \'{name}\' already exists")
+            
+            self.models[name] = butt_pad
+            self._watch(name, butt_pad)
+        self._publish(name, Region.ofSize(butt_pad.getSize()), getattr(butt_pad, 'version', 0))
 
     def getData(self, name: str) -> ButtonPad:
-        if name not in self.models:
-            raise KeyError(f"[Stock][getData] Data with name \'{name}\' doesn't exists")
-        
-        return self.models[name]
+        with self._lock:
+            if name not in self.models:
+                raise KeyError(f"[Stock][getData] Data with name \'{name}\' doesn't exists")
+            
+            return self.models[name]
 
     def delData(self, name: str) -> None:
-        if name not in self.models:
-            raise KeyError(f"[Stock][getData] Data with name \'{name}\' doesn't exists")
-        
-        del self.models[name]
+        with self._lock:
+            if name not in self.models:
+                raise KeyError(f"[Stock][getData] Data with name \'{name}\' doesn't exists")
+            
+            del self.models[name]
+            if name in self._unsubscribe:
+                self._unsubscribe.pop(name)()
+        self._publish(name, None, 0)
+
+    def getNames(self) -> tuple[str, ...]:
+        with self._lock:
+            return tuple(self.models.keys())
 
-    def getNames(self):
-        return self.models.keys()
+    def getItems(self) -> tuple[tuple[str, ButtonPad], ...]:
+        with self._lock:
+            return tuple(self.models.items())
 
 
 if __name__ == '__main__':
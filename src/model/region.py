@@ -0,0 +1,46 @@
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass(init=True, repr=True, eq=True, frozen=True)
+class Region:
+    """Half-open rectangle of bitmap cells: x in [x_min, x_max), y in [y_min, y_max)"""
+    x_min: int
+    y_min: int
+    x_max: int
+    y_max: int
+
+    def ofCell(x: int, y: int) -> 'Region':
+        return Region(x, y, x + 1, y + 1)
+
+    def ofSize(size: tuple[int, int]) -> 'Region':
+        return Region(0, 0, size[0], size[1])
+
+    @property
+    def slices(self) -> tuple[slice, slice]:
+        return slice(self.x_min, self.x_max), slice(self.y_min, self.y_max)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.x_max - self.x_min, self.y_max - self.y_min
+
+    @property
+    def area(self) -> int:
+        w, h = self.shape
+        return w * h
+
+    def isEmpty(self) -> bool:
+        return self.x_max <= self.x_min or self.y_max <= self.y_min
+
+    def union(self, other: Optional['Region']) -> 'Region':
+        if other is None:
+            return self
+        return Region(min(self.x_min, other.x_min), min(self.y_min, other.y_min),
+                      max(self.x_max, other.x_max), max(self.y_max, other.y_max))
+
+    def intersection(self, other: 'Region') -> Optional['Region']:
+        res = Region(max(self.x_min, other.x_min), max(self.y_min, other.y_min),
+                     min(self.x_max, other.x_max), min(self.y_max, other.y_max))
+        return None if res.isEmpty() else res
+
+    def intersects(self, other: 'Region') -> bool:
+        return self.intersection(other) is not None
@@ -0,0 +1,173 @@
+from hashlib import sha1
+from os.path import expanduser, join, exists
+from threading import Event, Thread, Lock
+from typing import Any, Optional
+import json
+import os
+import numpy as np
+
+from model.chunked import ChunkedBitmap
+from model.model import DataStock, MapData
+
+class SessionStore:
+    """
+    Workspace persistence for a DataStock.
+
+    Every map is stored next to a small `session.json` index: dense bitmaps
+    as `.npy` files that are memory-mapped copy-on-write on restore (only the
+    header is read, pages are loaded on first access, edits never reach the
+    file before a save), sparse bitmaps as an `.npz` of their allocated
+    chunks, read on first access. Only maps changed since the last save are
+    written, only files of the previous index are ever removed.
+    """
+    _INDEX = 'session.json'
+    _FORMAT = 1
+
+    def __init__(self, path: str):
+        self.path = expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._saved: dict[str, tuple[int, int]] = dict()
+        self._lock = Lock()
+        self._stop = Event()
+        self._autosave: Optional[Thread] = None
+
+    def _fileName(name: str, sparse: bool) -> str:
+        return sha1(name.encode()).hexdigest()[:16] + ('.npz' if sparse else '.npy')
+
+    def _readIndex(self) -> list[dict]:
+        index_path = join(self.path, SessionStore._INDEX)
+        if not exists(index_path):
+            return []
+        with open(index_path) as index:
+            return json.load(index)['maps']
+
+    def _writeIndex(self, entries: list[dict]) -> None:
+        index_path = join(self.path, SessionStore._INDEX)
+        with open(index_path + '.tmp', 'w') as index:
+            json.dump(dict(format=SessionStore._FORMAT, maps=entries), index, indent=1)
+        os.replace(index_path + '.tmp', index_path)
+
+    def _snapshot(model: MapData) -> tuple[tuple[int, int], Any]:
+        """Save state and a private copy of the bitmap, taken between two edits"""
+        with model.lock:
+            state = (model.token, model.version)
+            if isinstance(model.bitmap, ChunkedBitmap):
+                bitmap = model.bitmap
+                chunks = [(key, chunk.copy()) for key, chunk in list(bitmap.chunks().items())]
+                return state, (bitmap.shape, bitmap.dtype, bitmap.chunk, chunks)
+            return state, np.array(model.bitmap)
+
+    def _saveDense(self, path: str, bitmap: np.ndarray) -> None:
+        # a restored copy-on-write map may be mapped from `path` itself, replacing keeps its pages valid
+        out = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=bitmap.dtype, shape=bitmap.shape)
+        out[...] = bitmap
+        out.flush()
+        del out
+        os.replace(path + '.tmp', path)
+
+    def _saveSparse(self, path: str, snapshot: tuple) -> None:
+        shape, dtype, chunk, chunks = snapshot
+        keys = np.array([key for key, _ in chunks], dtype=np.int64).reshape(-1, 2)
+        data = np.array([data for _, data in chunks], dtype=dtype).reshape(-1, chunk, chunk)
+
+        with open(path + '.tmp', 'wb') as out:
+            np.savez(out, shape=np.array(shape), chunk=np.array(chunk), keys=keys, data=data)
+        os.replace(path + '.tmp', path)
+
+    def _readChunks(path: str) -> dict[tuple[int, int], np.ndarray]:
+        with np.load(path) as archive:
+            return {tuple(int(k) for k in key): np.array(chunk)
+                    for key, chunk in zip(archive['keys'], archive['data'])}
+
+    def _loadSparse(path: str, entry: dict) -> ChunkedBitmap:
+        """Sparse bitmap reading its chunks only on first access"""
+        with np.load(path) as archive:
+            shape, chunk = tuple(int(v) for v in archive['shape']), int(archive['chunk'])
+        return ChunkedBitmap.lazy(shape, entry.get('dtype', 'uint8'), chunk,
+                                  lambda: SessionStore._readChunks(path))
+
+    def isDirty(self, model: MapData) -> bool:
+        return self._saved.get(model.name) != (model.token, model.version)
+
+    def restore(self, stock: Optional[DataStock] = None) -> DataStock:
+        """Adds every map of the session to `stock` without reading bitmaps"""
+        stock = DataStock() if stock is None else stock
+
+        for entry in self._readIndex():
+            path = join(self.path, entry['file'])
+            if not exists(path):
+                print(f'[Session][restore] Missing \'{entry["file"]}\' for \'{entry["name"]}\'')
+                continue
+
+            if entry['sparse']:
+                bitmap = SessionStore._loadSparse(path, entry)
+            else:
+                bitmap = np.load(path, mmap_mode='c')
+
+            model = MapData(entry['name'], bitmap=bitmap, inject=entry['inject'])
+            stock.addData(model.name, model)
+            self._saved[model.name] = (model.token, model.version)
+
+        return stock
+
+    def save(self, stock: DataStock) -> list[str]:
+        """Writes maps changed since the last save, returns their names"""
+        with self._lock:
+            models = stock.getItems()
+            previous = {entry['file'] for entry in self._readIndex()}
+            entries, saved = [], []
+
+            for name, model in models:
+                sparse = isinstance(model.bitmap, ChunkedBitmap)
+                file_name = SessionStore._fileName(name, sparse)
+                entries.append(dict(name=name, file=file_name, inject=model.inject, sparse=sparse,
+                                    shape=[int(v) for v in model.getSize()], dtype=str(model.bitmap.dtype)))
+
+                if not self.isDirty(model):
+                    continue
+
+                # edits after the snapshot leave the model dirty for the next save
+                state, bitmap = SessionStore._snapshot(model)
+                path = join(self.path, file_name)
+                if sparse:
+                    self._saveSparse(path, bitmap)
+                else:
+                    self._saveDense(path, bitmap)
+                self._saved[name] = state
+                saved.append(name)
+
+            self._writeIndex(entries)
+
+            # files of removed or renamed maps, anything else in the directory is not ours
+            for file_name in previous - {entry['file'] for entry in entries}:
+                if exists(join(self.path, file_name)):
+                    os.remove(join(self.path, file_name))
+            for name in set(self._saved) - {name for name, _ in models}:
+                del self._saved[name]
+
+        if saved:
+            print(f'[Session][save] {saved}')
+        return saved
+
+    def startAutosave(self, stock: DataStock, interval: float = 30.0) -> None:
+        """Saves dirty maps every `interval` seconds from a background thread"""
+        if self._autosave is not None:
+            return
+
+        def autosave():
+            while not self._stop.wait(interval):
+                try:
+                    self.save(stock)
+                except (OSError, RuntimeError) as e:
+                    print(f'[Session][autosave] {e}')
+
+        self._stop.clear()
+        self._autosave = Thread(target=autosave, name='session-autosave', daemon=True)
+        self._autosave.start()
+
+    def stopAutosave(self) -> None:
+        if self._autosave is None:
+            return
+        self._stop.set()
+        self._autosave.join()
+        self._autosave = None
@@ -0,0 +1,194 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from heapq import heappush, heappop
+from typing import Optional
+import numpy as np
+
+from utills import DuckieMap
+
+Cell = tuple[int, int]
+
+@dataclass(init=True, repr=True, eq=True, frozen=True)
+class RoadEdge:
+    a: int
+    b: int
+    length: int
+    cells: tuple[Cell, ...]
+
+
+class _DisjointSet:
+    def __init__(self, size: int):
+        self._parent = list(range(size))
+        self._size = [1] * size
+
+    def find(self, i: int) -> int:
+        parent = self._parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return
+        if self._size[i] < self._size[j]:
+            i, j = j, i
+        self._parent[j] = i
+        self._size[i] += self._size[j]
+
+
+class RoadGraph:
+    """
+    Road network of a Duckietown map.
+
+    Nodes are intersections and dead ends, edges are the straight and curve
+    runs between them. Built on top of `MapBuilder._bitmap2duckie` output:
+
+        graph = RoadGraph.fromDuckie(MapBuilder._bitmap2duckie(bitmap))
+        graph.isConnected(), graph.distance((0, 2), (6, 5))
+    """
+    _MOVES = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+    def __init__(self, road: np.ndarray, cache_size: Optional[int] = 1024):
+        self.road = np.asarray(road, dtype=bool)
+        self.nodes: list[Cell] = []
+        self.edges: list[RoadEdge] = []
+        self.adjacency: list[list[tuple[int, int]]] = []
+
+        rows, cols = self.road.shape[:2]
+        self._cell_node   = np.full((rows, cols), -1, dtype=np.int32)
+        self._cell_edge   = np.full((rows, cols), -1, dtype=np.int32)
+        self._cell_offset = np.zeros((rows, cols), dtype=np.int32)
+
+        self._build()
+
+        self._components = _DisjointSet(len(self.nodes))
+        for edge in self.edges:
+            self._components.union(edge.a, edge.b)
+
+        self._distancesFrom = lru_cache(maxsize=cache_size)(self._dijkstra)
+
+    def fromDuckie(duckie: DuckieMap, cache_size: Optional[int] = 1024) -> 'RoadGraph':
+        road = np.array([[tile != 'floor' for tile in line] for line in duckie.tiles], dtype=bool)
+        return RoadGraph(road, cache_size)
+
+    def _degree(self) -> np.ndarray:
+        padded = np.pad(self.road, 1).astype(np.int8)
+        degree = padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:]
+        return np.where(self.road, degree, 0)
+
+    def _roadNeighbours(self, cell: Cell) -> list[Cell]:
+        rows, cols = self.road.shape[:2]
+        x, y = cell
+        return [(x + dx, y + dy) for dx, dy in RoadGraph._MOVES
+                if 0 <= x + dx < rows and 0 <= y + dy < cols and self.road[x + dx, y + dy]]
+
+    def _addNode(self, cell: Cell) -> int:
+        self._cell_node[cell] = len(self.nodes)
+        self.nodes.append(cell)
+        self.adjacency.append([])
+        return int(self._cell_node[cell])
+
+    def _walk(self, start: int, first: Cell) -> None:
+        """Follows a run of degree-2 cells from node `start` until the next node"""
+        previous, current = self.nodes[start], first
+        cells = []
+
+        while self._cell_node[current] < 0:
+            if self._cell_edge[current] >= 0:
+                return  # already walked from the other end
+            cells.append(current)
+            following = [n for n in self._roadNeighbours(current) if n != previous]
+            previous, current = current, following[0]
+
+        edge_id = len(self.edges)
+        for offset, cell in enumerate(cells):
+            self._cell_edge[cell] = edge_id
+            self._cell_offset[cell] = offset
+
+        end = int(self._cell_node[current])
+        if not cells and start > end:
+            return  # adjacent nodes, edge was added from the other side
+
+        length = len(cells) + 1
+        self.edges.append(RoadEdge(start, end, length, tuple(cells)))
+        self.adjacency[start].append((end, length))
+        if end != start:
+            self.adjacency[end].append((start, length))
+
+    def _build(self) -> None:
+        degree = self._degree()
+
+        for cell in zip(*np.nonzero(self.road & (degree != 2))):
+            self._addNode(tuple(map(int, cell)))
+        for node in range(len(self.nodes)):
+            for first in self._roadNeighbours(self.nodes[node]):
+                self._walk(node, first)
+
+        # loops without intersections get an arbitrary cell promoted to node
+        for cell in zip(*np.nonzero(self.road & (self._cell_node < 0) & (self._cell_edge < 0))):
+            cell = tuple(map(int, cell))
+            if self._cell_edge[cell] >= 0:
+                continue
+            node = self._addNode(cell)
+            self._walk(node, self._roadNeighbours(cell)[0])
+
+    def _dijkstra(self, source: int) -> dict[int, int]:
+        distances = {source: 0}
+        queue = [(0, source)]
+
+        while queue:
+            distance, node = heappop(queue)
+            if distance > distances[node]:
+                continue
+            for neighbour, length in self.adjacency[node]:
+                candidate = distance + length
+                if candidate < distances.get(neighbour, candidate + 1):
+                    distances[neighbour] = candidate
+                    heappush(queue, (candidate, neighbour))
+
+        return distances
+
+    def _anchors(self, cell: Cell) -> list[tuple[int, int]]:
+        """Nodes reachable from `cell` along its own edge with their distances"""
+        node = self._cell_node[cell]
+        if node >= 0:
+            return [(int(node), 0)]
+
+        edge_id = self._cell_edge[cell]
+        if edge_id < 0:
+            raise KeyError(f"[RoadGraph] Cell {cell} is not a road")
+
+        edge = self.edges[edge_id]
+        offset = int(self._cell_offset[cell]) + 1
+        return [(edge.a, offset), (edge.b, edge.length - offset)]
+
+    def componentCount(self) -> int:
+        return len({self._components.find(node) for node in range(len(self.nodes))})
+
+    def isConnected(self) -> bool:
+        return self.componentCount() <= 1
+
+    def connected(self, a: Cell, b: Cell) -> bool:
+        return self._components.find(self._anchors(a)[0][0]) \
+            == self._components.find(self._anchors(b)[0][0])
+
+    def distance(self, a: Cell, b: Cell) -> Optional[int]:
+        """Length of the shortest route between two road cells in tiles, None if unreachable"""
+        if not self.connected(a, b):
+            return None
+
+        best = None
+        edge_a, edge_b = self._cell_edge[a], self._cell_edge[b]
+        if edge_a >= 0 and edge_a == edge_b:
+            best = abs(int(self._cell_offset[a]) - int(self._cell_offset[b]))
+
+        for source, to_source in self._anchors(a):
+            distances = self._distancesFrom(source)
+            for target, to_target in self._anchors(b):
+                if target in distances:
+                    candidate = to_source + distances[target] + to_target
+                    best = candidate if best is None else min(best, candidate)
+
+        return best
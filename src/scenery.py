@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional, Union
+import numpy as np
+
+from utills import DuckieObject
+
+@dataclass(init=True, repr=True, eq=False, frozen=True)
+class ObjectTemplate:
+    """Group of objects placed together, offsets are relative to the anchor in map units"""
+    name: str
+    kinds: tuple[str, ...]
+    offsets: np.ndarray
+    heights: np.ndarray
+    rotates: np.ndarray = None
+
+    def __post_init__(self):
+        object.__setattr__(self, 'offsets', np.asarray(self.offsets, dtype=np.float64).reshape(-1, 2))
+        object.__setattr__(self, 'heights', np.asarray(self.heights, dtype=np.float64))
+        rotates = np.zeros(len(self.kinds)) if self.rotates is None else self.rotates
+        object.__setattr__(self, 'rotates', np.asarray(rotates, dtype=np.float64))
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+
+TEMPLATES = {
+    'tree_cluster': ObjectTemplate('tree_cluster', ('tree',) * 3,
+        [[0.0, 0.0], [0.2, 0.4], [0.5, -0.2]], [0.7, 0.6, 0.5]),
+    'duckie_group': ObjectTemplate('duckie_group', ('duckie',) * 3,
+        [[0.0, 0.0], [0.15, 0.1], [0.05, 0.2]], [0.10, 0.08, 0.09], [0, 120, 240]),
+    'sign_set': ObjectTemplate('sign_set', ('sign_stop', 'sign_yield'),
+        [[0.0, 0.0], [0.0, 0.3]], [0.2, 0.2], [0, 0]),
+}
+
+
+class _SpatialHash:
+    def __init__(self, cell: float):
+        self.cell = cell
+        self._buckets: dict[tuple[int, int], list[np.ndarray]] = dict()
+
+    def _key(self, point: np.ndarray) -> tuple[int, int]:
+        return int(np.floor(point[0] / self.cell)), int(np.floor(point[1] / self.cell))
+
+    def near(self, point: np.ndarray) -> Iterable[np.ndarray]:
+        kx, ky = self._key(point)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                yield from self._buckets.get((kx + dx, ky + dy), ())
+
+    def add(self, point: np.ndarray) -> None:
+        self._buckets.setdefault(self._key(point), []).append(point)
+
+
+class SceneryStamper:
+    """
+    Places object templates at many anchors at once.
+
+    Positions of every instance are computed in one vectorized transform
+    (rotation around the anchor, offset, jitter). Instances are then kept
+    or rejected as a whole: no object may stand on a road cell of `bitmap`
+    (within `road_margin`), leave the map or come closer than `min_distance`
+    to an already placed object.
+
+    Coordinates are Duckietown object coordinates, see
+    `MapBuilder._getMapOfVisibleObjects` for the mapping to bitmap cells.
+    """
+    def __init__(self, bitmap: Optional[np.ndarray] = None, *, min_distance: float = 0.3,
+                 road_margin: float = 0.1, seed: Optional[int] = None):
+        self.bitmap = None if bitmap is None else np.asarray(bitmap)
+        self.min_distance = min_distance
+        self.road_margin = road_margin
+        self.objects: list[DuckieObject] = []
+        self._rng = np.random.default_rng(seed)
+        self._hash = _SpatialHash(max(min_distance, 1e-6))
+
+    def add(self, objects: Iterable[DuckieObject]) -> None:
+        """Registers objects placed by other means (signs, random objects) as obstacles"""
+        for obj in objects:
+            self._hash.add(np.array((obj.x, obj.y)))
+
+    def _onRoad(self, positions: np.ndarray) -> np.ndarray:
+        """Mask of positions (..., 2) on a road cell or outside the map"""
+        if self.bitmap is None:
+            return np.zeros(positions.shape[:-1], dtype=bool)
+
+        w, h = self.bitmap.shape[:2]
+        margin = self.road_margin
+        res = np.zeros(positions.shape[:-1], dtype=bool)
+        for dx, dy in ((0, 0), (margin, 0), (-margin, 0), (0, margin), (0, -margin)):
+            row = np.floor(positions[..., 1] + dy + w - h + 1).astype(np.int64)
+            col = np.floor(positions[..., 0] + dx).astype(np.int64)
+            inside = (0 <= row) & (row < w) & (0 <= col) & (col < h)
+            road = np.zeros_like(inside)
+            road[inside] = self.bitmap[row[inside], col[inside]] != 0
+            res |= road | ~inside
+        return res
+
+    def _collides(self, points: np.ndarray) -> bool:
+        limit = self.min_distance ** 2
+        return any(np.sum((point - other) ** 2) < limit
+                   for point in points for other in self._hash.near(point))
+
+    def stamp(self, template: Union[str, ObjectTemplate], anchors: np.ndarray, *,
+              rotation: Union[float, np.ndarray] = 0.0, jitter: float = 0.0,
+              spin: float = 0.0) -> list[DuckieObject]:
+        """
+        Stamps `template` at every anchor (M, 2). `rotation` in degrees turns each
+        instance around its anchor, `jitter` is the standard deviation of the
+        per-object position noise and `spin` the range of random extra rotation.
+        Returns the accepted objects, which are also appended to `objects`.
+        """
+        template = TEMPLATES[template] if isinstance(template, str) else template
+        anchors = np.asarray(anchors, dtype=np.float64).reshape(-1, 2)
+        m, n = len(anchors), len(template)
+
+        angles = np.deg2rad(np.broadcast_to(np.asarray(rotation, dtype=np.float64), (m,)))
+        cos, sin = np.cos(angles)[:, None], np.sin(angles)[:, None]
+        ox, oy = template.offsets[:, 0], template.offsets[:, 1]
+        positions = anchors[:, None, :] + np.stack((cos*ox - sin*oy, sin*ox + cos*oy), axis=-1)
+        if jitter > 0:
+            positions += self._rng.normal(0.0, jitter, positions.shape)
+
+        rotates = template.rotates[None, :] + np.rad2deg(angles)[:, None]
+        if spin > 0:
+            rotates = rotates + self._rng.uniform(-spin, spin, (m, n))
+        rotates = np.rint(rotates).astype(np.int64) % 360
+
+        candidates = ~np.any(self._onRoad(positions), axis=1)
+
+        accepted = []
+        for i in np.flatnonzero(candidates):
+            if self._collides(positions[i]):
+                continue
+            for point in positions[i]:
+                self._hash.add(point)
+            accepted += [DuckieObject(kind, int(rotate), round(float(x), 2), round(float(y), 2), float(height))
+                         for kind, (x, y), rotate, height
+                         in zip(template.kinds, positions[i], rotates[i], template.heights)]
+
+        self.objects += accepted
+        return accepted
@@ -0,0 +1,89 @@
+from glob import glob
+from os.path import getmtime, exists, join
+from typing import Optional
+import os
+import numpy as np
+
+_SUFFIX = '.thumbs.npz'
+
+def _pad_even(grid: np.ndarray) -> np.ndarray:
+    pad = [(0, size % 2) for size in grid.shape]
+    return np.pad(grid, pad, mode='edge') if any(p for _, p in pad) else grid
+
+def _blocks(grid: np.ndarray) -> np.ndarray:
+    """(h/2, w/2, 4) view of the 2x2 blocks of a grid with odd sides padded"""
+    grid = _pad_even(grid)
+    h, w = grid.shape
+    return grid.reshape(h // 2, 2, w // 2, 2).swapaxes(1, 2).reshape(h // 2, w // 2, 4)
+
+def road_pyramid(bitmap: np.ndarray, min_size: int = 1) -> list[np.ndarray]:
+    """Road coverage levels, level 0 is the road mask as 0/255, every next level halves both sides"""
+    levels = [np.where(np.asarray(bitmap) != 0, 255, 0).astype(np.uint8)]
+    while max(levels[-1].shape) > min_size and min(levels[-1].shape) > 1:
+        levels.append(np.rint(_blocks(levels[-1]).mean(axis=2, dtype=np.float32)).astype(np.uint8))
+    return levels
+
+def tile_pyramid(codes: np.ndarray, min_size: int = 1) -> list[np.ndarray]:
+    """Tile kind levels, a block keeps its highest code so roads (floor is 0) survive downscaling"""
+    levels = [np.asarray(codes, dtype=np.uint8)]
+    while max(levels[-1].shape) > min_size and min(levels[-1].shape) > 1:
+        levels.append(_blocks(levels[-1]).max(axis=2))
+    return levels
+
+def pick_level(shapes: list[tuple[int, int]], size: int) -> int:
+    """First level fitting into `size` pixels, the smallest one if none does"""
+    for level, shape in enumerate(shapes):
+        if max(shape) <= size:
+            return level
+    return len(shapes) - 1
+
+
+class ThumbnailCache:
+    """
+    Thumbnail pyramids of saved maps, cached on disk as `<map>.thumbs.npz`.
+
+    Maps are MapArchive `.npz` files or `.npy` bitmaps. A cache file is
+    rebuilt when it is older than its map. Reading a thumbnail only decodes
+    the requested level of the cache file.
+    """
+    def scan(directory: str) -> list[str]:
+        paths = glob(join(directory, '*.npz')) + glob(join(directory, '*.npy'))
+        return sorted(path for path in paths if not path.endswith(_SUFFIX))
+
+    def cachePath(path: str) -> str:
+        return path + _SUFFIX
+
+    def _readMap(path: str) -> tuple[np.ndarray, Optional[np.ndarray]]:
+        if path.endswith('.npy'):
+            return np.load(path, mmap_mode='r'), None
+        with np.load(path, allow_pickle=False) as archive:
+            return archive['bitmap'], archive['tiles'] if 'tiles' in archive.files else None
+
+    def build(path: str) -> str:
+        """Writes the pyramid of a map next to it, returns the cache path"""
+        bitmap, codes = ThumbnailCache._readMap(path)
+        roads = road_pyramid(bitmap)
+        arrays = {f'road{level}': grid for level, grid in enumerate(roads)}
+        # tile grids have the bitmap's shape, so both pyramids share the level shapes
+        if codes is not None:
+            arrays.update({f'tiles{level}': grid for level, grid in enumerate(tile_pyramid(codes))})
+        arrays['shapes'] = np.array([grid.shape for grid in roads], dtype=np.int64)
+
+        cache = ThumbnailCache.cachePath(path)
+        temporary = cache + '.tmp'
+        with open(temporary, 'wb') as out:
+            np.savez_compressed(out, **arrays)
+        os.replace(temporary, cache)
+        return cache
+
+    def load(path: str, size: int, kind: str = 'road') -> np.ndarray:
+        """Largest `kind` level ('road' or 'tiles') of a map fitting into `size` pixels"""
+        cache = ThumbnailCache.cachePath(path)
+        if not exists(cache) or getmtime(cache) < getmtime(path):
+            ThumbnailCache.build(path)
+
+        with np.load(cache, allow_pickle=False) as thumbs:
+            if f'{kind}0' not in thumbs.files:
+                raise KeyError(f'[ThumbnailCache][load] No {kind} levels for \'{path}\'')
+            level = pick_level([tuple(shape) for shape in thumbs['shapes']], size)
+            return thumbs[f'{kind}{level}']
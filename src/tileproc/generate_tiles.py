@@ -3,48 +3,24 @@ from logging import Logger
 import numpy as np
 from PIL import Image
 
-def generate_tiles():
-    print(f'[TileGenerator] Generating...')
-
-    corners = ((0,0,-1,-1), (0,-1,-1,0))
-
-    tile_none = np.zeros((4,4), dtype=np.uint8)
-    # cv2.imshow("4way", tile_none)
-
-    tile_4way = np.full((4,4), 255, dtype=np.uint8)
-    tile_4way[corners] = 0
-    # cv2.imshow("4way", tile_4way)
+from tileproc.tile_compiler import road_tile
 
-    tile_3way = np.full((4,4), 255, dtype=np.uint8)
-    tile_3way[corners] = 0
-    tile_3way[0,:] = 0
-    # cv2.imshow("3way", tile_3way)
-
-    tile_stgh = np.full((4,4), 255, dtype=np.uint8)
-    tile_stgh[corners] = 0
-    tile_stgh[0,:] = 0
-    tile_stgh[-1,:] = 0
-    # cv2.imshow("stgh", tile_stgh)
-
-    tile_bend = np.full((4,4), 255, dtype=np.uint8)
-    tile_bend[corners] = 0
-    tile_bend[0,:] = 0
-    tile_bend[:,0] = 0
-    # cv2.imshow("bend", tile_bend)
+def generate_tiles(size: int = 4, width: int = 2):
+    """Writes the road tile set, `size` pixels per tile with roads `width` pixels wide"""
+    print(f'[TileGenerator] Generating...')
 
-    # cv2.waitKey(0)
+    tiles = {'none': road_tile('', size, width),
+             '4way': road_tile('NESW', size, width),
+             '3way': road_tile('ESW', size, width),
+             'stgh': road_tile('EW', size, width),
+             'bend': road_tile('ES', size, width)}
 
     print(f'[TileGenerator] Saving...')
 
     # TODO: make dir if doesn't exist
 
-    Image.fromarray(tile_none).save("resources/tiles/none.png")
-    Image.fromarray(tile_4way).save("resources/tiles/4way.png")
-    Image.fromarray(tile_3way).save("resources/tiles/3way.png")
-    Image.fromarray(tile_stgh).save("resources/tiles/stgh.png")
-    Image.fromarray(tile_bend).save("resources/tiles/bend.png")
-
-    # cv2.destroyAllWindows()
+    for name, tile in tiles.items():
+        Image.fromarray(tile).save(f"resources/tiles/{name}.png")
 
     print(f'[TileGenerator] Done!')
 
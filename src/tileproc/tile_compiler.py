@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+from typing import Union
+import numpy as np
+from PIL import Image
+
+from tileproc.tile_processing import Tile
+
+# side order matches utills.Direction: DOWN, RIGHT, UP, LEFT
+DOWN, RIGHT, UP, LEFT = range(4)
+OPPOSITE = (UP, LEFT, DOWN, RIGHT)
+
+TileSource = Union[np.ndarray, Image.Image, str, list]
+
+@dataclass(init=True, repr=False, eq=False, frozen=True)
+class TileSet:
+    """
+    Compiled tile set.
+
+    `sides[t, d]` is the integer id of the full edge signature of tile `t` on
+    side `d`, two tiles fit when the touching sides have the same id.
+    `compatible[d, a, b]` tells whether tile `b` may be placed on side `d`
+    of tile `a`.
+    """
+    names: tuple[str, ...]
+    bitmaps: np.ndarray
+    sides: np.ndarray
+    weights: np.ndarray
+    compatible: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def toTiles(self) -> list[Tile]:
+        return [Tile(name, Image.fromarray(bitmap), tuple(int(s) for s in sides), float(weight))
+                for name, bitmap, sides, weight in zip(self.names, self.bitmaps, self.sides, self.weights)]
+
+def _as_array(source: TileSource) -> np.ndarray:
+    if isinstance(source, str):
+        source = Image.open(source)
+    if isinstance(source, Image.Image):
+        source = source.convert('L')
+    bitmap = np.asarray(source, dtype=np.uint8)
+    if bitmap.ndim != 2 or bitmap.shape[0] != bitmap.shape[1]:
+        raise ValueError(f'[TileCompiler] Tiles must be square 2D bitmaps, got shape {bitmap.shape}')
+    return bitmap
+
+def _variants(bitmap: np.ndarray, reflections: bool) -> np.ndarray:
+    """Unique rotations (and reflections) of a tile, in np.unique order"""
+    variants = [np.rot90(bitmap, k) for k in range(4)]
+    if reflections:
+        variants += [np.fliplr(variant) for variant in variants]
+    return np.unique(np.array(variants), axis=0)
+
+def _edges(bitmap: np.ndarray) -> tuple[np.ndarray, ...]:
+    """Edges read so that touching sides of two neighbours are equal arrays"""
+    return bitmap[-1, :], bitmap[:, -1], bitmap[0, :], bitmap[:, 0]
+
+def road_tile(arms: str, size: int = 4, width: int = 2) -> np.ndarray:
+    """
+    Descriptor for road tiles at any resolution: a centered road of `width`
+    pixels with an arm towards every side listed in `arms` ('N', 'E', 'S', 'W').
+    """
+    low, high = (size - width) // 2, (size - width) // 2 + width
+    bitmap = np.zeros((size, size), dtype=np.uint8)
+    if arms:
+        bitmap[low:high, low:high] = 255
+    if 'N' in arms:
+        bitmap[:low, low:high] = 255
+    if 'S' in arms:
+        bitmap[high:, low:high] = 255
+    if 'W' in arms:
+        bitmap[low:high, :low] = 255
+    if 'E' in arms:
+        bitmap[low:high, high:] = 255
+    return bitmap
+
+def compile_tiles(sources: dict[str, TileSource], *, reflections: bool = False,
+                  weights: dict[str, float] = None) -> TileSet:
+    """
+    Compiles tile images or descriptors into a TileSet.
+
+    Every source expands into its unique rotations (and reflections), edge
+    signatures are interned into integer ids and the adjacency table is
+    built from id equality. The weight of a source is split evenly between
+    its variants.
+    """
+    names, bitmaps, tile_weights = [], [], []
+    for name, source in sources.items():
+        variants = _variants(_as_array(source), reflections)
+        weight = 1.0 if weights is None else weights.get(name, 1.0)
+        for i, variant in enumerate(variants):
+            names.append(f'{name}_{i}')
+            bitmaps.append(variant)
+            tile_weights.append(weight / len(variants))
+
+    sizes = {bitmap.shape for bitmap in bitmaps}
+    if len(sizes) > 1:
+        raise ValueError(f'[TileCompiler] All tiles must have the same size, got {sizes}')
+
+    edge_ids: dict[bytes, int] = dict()
+    sides = np.array([[edge_ids.setdefault(edge.tobytes(), len(edge_ids)) for edge in _edges(bitmap)]
+                      for bitmap in bitmaps], dtype=np.int32).reshape(-1, 4)
+
+    compatible = np.array([sides[:, d, None] == sides[None, :, OPPOSITE[d]] for d in range(4)])
+
+    return TileSet(tuple(names), np.array(bitmaps), sides, np.array(tile_weights), compatible)
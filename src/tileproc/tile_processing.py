@@ -2,7 +2,6 @@ from collections import namedtuple
 import numpy as np
 from PIL import Image
 
-import cv2
 Tile = namedtuple('Tile', ('name', 'bitmap', 'sides', 'weight'))
 
 # TODO: replace hardcoded names with directory scanning
@@ -42,41 +41,28 @@ def state2image(map_state: np.ndarray, tiles: list[Tile]) -> Image.Image:
 
     return Image.fromarray(images.reshape(n_rows*tile_height, n_cols*tile_width))
 
+def state2array(map_state: np.ndarray, tiles: 'TileSet') -> np.ndarray:
+    """
+    Vectorized state2image: every cell is the mean of the tiles that haven't
+    been ruled out, returned as a uint8 array.
+    """
+    stack = np.asarray(tiles.bitmaps, dtype=np.float32)
+    n_tiles, tile_height, tile_width = stack.shape[:3]
+
+    counts = np.maximum(np.sum(map_state, axis=2, keepdims=True), 1)
+    blended = np.tensordot(map_state.astype(np.float32), stack, axes=(2, 0)) / counts[..., None]
+
+    n_rows, n_cols = map_state.shape[:2]
+    images = np.swapaxes(blended, 1, 2).reshape(n_rows*tile_height, n_cols*tile_width)
+
+    return np.rint(images).astype(np.uint8)
 
 def get_tile_names() -> list[str]:
     return TILE_NAMES.copy()
 
-def _get_tile_sides(bitmap: np.ndarray) -> list[bool]:
-    h, w = bitmap.shape[:2]
-    side_centers = ((-1, h//2), (w//2, -1), (0, h//2), (w//2, 0))
-    
-    sides = [bitmap[center] == 255 for center in side_centers]
-
-    return sides
-
-def _get_tile_rotations(name: str, bitmap: Image.Image) -> list[Tile]:
-    rotations = np.array([
-        np.array(bitmap), 
-        np.array(bitmap.transpose(Image.ROTATE_90)),
-        np.array(bitmap.transpose(Image.ROTATE_180)),
-        np.array(bitmap.transpose(Image.ROTATE_270))
-        ])
-
-    unique_states = np.unique(rotations, axis=0)
-    unique_count  = len(unique_states)
-
-    return [Tile(
-                f'{name}_{i}', 
-                Image.fromarray(map), 
-                _get_tile_sides(map), 
-                1/unique_count
-            ) for i, map in enumerate(unique_states)]
-
-def get_tiles() -> list[Tile]:
-    tile_bitmaps = {name: Image.open(f'{TILES_PATH}/{name}.png') for name in TILE_NAMES}
+def get_tiles() -> 'TileSet':
+    from tileproc.tile_compiler import compile_tiles
 
-    tiles = []
-    for name in TILE_NAMES:
-        tiles += _get_tile_rotations(name, tile_bitmaps[name])
+    tile_bitmaps = {name: Image.open(f'{TILES_PATH}/{name}.png') for name in TILE_NAMES}
 
-    return tiles
+    return compile_tiles(tile_bitmaps)
@@ -1,9 +1,9 @@
 from abc import ABC, abstractmethod
-from copy import deepcopy
-from typing import Protocol, Tuple, overload
+from math import atan2, hypot
+from typing import Optional, Protocol, Tuple, overload
 from dataclasses import dataclass, field
 from enum import Enum
-from numpy.linalg import norm
+from functools import lru_cache
 import numpy as np
 
 class Direction(Enum):
@@ -31,6 +31,49 @@ class Direction(Enum):
                 Direction.UP: Direction.DOWN,
                 Direction.DOWN: Direction.UP}[self]
 
+    @property
+    def offset(self) -> tuple[int, int]:
+        """(dx, dy) of the neighbour in this direction, x indexes rows"""
+        return ((1, 0), (0, 1), (-1, 0), (0, -1))[self.value]
+
+
+@dataclass(init=True, repr=False, eq=False, frozen=True)
+class GridTopology:
+    """
+    Neighbour lookup of a height x width grid, shared through `GridTopology.of`.
+
+    Cells are flat row-major indices, `neighbors[d.value, i]` is the flat index
+    of the neighbour of cell `i` in Direction `d` or NONE past the border.
+    Indexing an array with one extra trailing element by `neighbors` maps
+    border neighbours to that element.
+    """
+    height: int
+    width: int
+    neighbors: np.ndarray
+
+    NONE = -1
+
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def of(height: int, width: int) -> 'GridTopology':
+        x, y = np.divmod(np.arange(height * width), width)
+        neighbors = np.full((4, height * width), GridTopology.NONE, dtype=np.int64)
+        for direction in Direction:
+            dx, dy = direction.offset
+            inside = (0 <= x + dx) & (x + dx < height) & (0 <= y + dy) & (y + dy < width)
+            neighbors[direction.value, inside] = (x + dx)[inside] * width + (y + dy)[inside]
+        neighbors.setflags(write=False)
+        return GridTopology(height, width, neighbors)
+
+    @property
+    def size(self) -> int:
+        return self.height * self.width
+
+    def neighborMask(self, mask: np.ndarray) -> np.ndarray:
+        """(4, height, width) booleans, whether the neighbour in each Direction is set in `mask`"""
+        padded = np.append(np.asarray(mask, dtype=bool).ravel(), False)
+        return padded[self.neighbors].reshape(4, self.height, self.width)
+
 @dataclass(init=True, repr=True, eq=True, frozen=True)
 class DuckieObject:
     type: str
@@ -42,9 +85,9 @@ class DuckieObject:
     def toGym(self, name: str) -> str:
         return f' {name}:\n'                         + \
                 f'  kind: {self.type}\n'              + \
-                f'  pos: [{self.x:.2}, {self.y:.2}]\n' + \
+                f'  pos: [{self.x:.2f}, {self.y:.2f}]\n' + \
                 f'  rotate: {self.rotate}\n'            + \
-                f'  height: {self.height:.2}\n'
+                f'  height: {self.height:.2f}\n'
 
     def getSignsFor3wayW(x, y):
         cx = x + 0.5
@@ -108,115 +151,140 @@ class DuckieBHeight:
         return self.max - self.min
 
 
-@dataclass(init=True)
+# bounding box (x_min, x_max, y_min, y_max), None for unbounded areas
+BBox = tuple[float, float, float, float]
+_EMPTY_BBOX: BBox = (np.inf, -np.inf, np.inf, -np.inf)
+
+@dataclass(init=True, repr=True, eq=True, frozen=True)
 class MathematicalArea(ABC):
-    __inverted: bool = field(default=False, init=False)
+    """Immutable area, `~area` is a lightweight InvertedArea wrapper"""
+    def isInverted(self) -> bool:
+        return False
 
-    def isInverted(self):
-        return self.__inverted
+    def __invert__(self) -> 'MathematicalArea':
+        return InvertedArea(self)
 
-    def __invert__(self):
-        new = deepcopy(self)
-        new.__inverted ^= True
-        return new
-    
     def __contains__(self, item: tuple[float, float]) -> bool:
-        return self.isInverted() ^ self._contains(item)
+        return self._contains(item)
+
+    def bbox(self) -> Optional[BBox]:
+        return None
 
     @abstractmethod
     def _contains(self, item: tuple[float, float]) -> bool:
         ...
-        
 
-@dataclass(init=True, repr=True, eq=True)
+
+@dataclass(init=True, repr=True, eq=True, frozen=True)
+class InvertedArea(MathematicalArea):
+    area: MathematicalArea
+
+    def isInverted(self) -> bool:
+        return True
+
+    def __invert__(self) -> MathematicalArea:
+        return self.area
+
+    def _contains(self, item: tuple[float, float]) -> bool:
+        return item not in self.area
+
+
+@dataclass(init=True, repr=True, eq=True, frozen=True)
 class RectArea(MathematicalArea):
     x_min: float = 0.0
     x_max: float = 0.0
     y_min: float = 0.0
     y_max: float = 0.0
 
-    def __post_init(self):
-        self.x_min -= 0.00001
-        self.x_max += 0.00001
-        self.y_min -= 0.00001
-        self.y_max += 0.00001
+    def bbox(self) -> BBox:
+        return self.x_min, self.x_max, self.y_min, self.y_max
+
     def _contains(self, item: tuple[float, float]) -> bool:
         return self.x_min <= item[0] <= self.x_max \
             and self.y_min <= item[1] <= self.y_max
 
 
-@dataclass(init=True, repr=True, eq=True)
+@dataclass(init=True, repr=True, eq=True, frozen=True)
 class SectArea(MathematicalArea):
     x_center:  float = 0.0
     y_center:  float = 0.0
     r:         float = 0.0
     theta_min: float = 0.0
     theta_max: float = 0.0
+    _view:     float = field(default=0.0, init=False, repr=False, compare=False)
+    _face:     float = field(default=0.0, init=False, repr=False, compare=False)
 
     def __post_init__(self):
-        self.theta_min %= 2*np.pi
-        self.theta_max %= 2*np.pi
-        self.r = 0.0 if self.r <= 0.0 else self.r
-
-    def _contains(self, item: tuple[float, float]) -> bool:
-        dr = np.array(item) - np.array((self.x_center, self.y_center))
-        d = norm(dr)
-
-        if d <= 0: return True
-
-        # phi = np.arccos(np.clip(np.dot(dr / d, np.array([1.0, 0.0])), -1.0, 1.0))
-        phi = np.arctan2(*dr)
-
-        # print(self.x_center, self.y_center) if d <= self.r else None
-
-        # print("phi", phi*180/np.pi) if d <= self.r else None
+        object.__setattr__(self, 'theta_min', self.theta_min % (2*np.pi))
+        object.__setattr__(self, 'theta_max', self.theta_max % (2*np.pi))
+        object.__setattr__(self, 'r', 0.0 if self.r <= 0.0 else self.r)
 
-        angle_view = self.theta_max - self.theta_min + 2*np.pi
-        angle_view %= 2*np.pi
+        angle_view = (self.theta_max - self.theta_min + 2*np.pi) % (2*np.pi)
+        object.__setattr__(self, '_view', angle_view)
+        object.__setattr__(self, '_face', (self.theta_min + angle_view / 2) % (2*np.pi))
 
-        # print("angle_view", angle_view * 180 / np.pi) if d <= self.r else None
+    def bbox(self) -> BBox:
+        return self.x_center - self.r, self.x_center + self.r, \
+            self.y_center - self.r, self.y_center + self.r
 
-        angle_face = self.theta_min + angle_view / 2
-        angle_face %= 2*np.pi
-
-        # print("angle_face", angle_face * 180 / np.pi) if d <= self.r else None
+    def _contains(self, item: tuple[float, float]) -> bool:
+        dx, dy = item[0] - self.x_center, item[1] - self.y_center
+        d = hypot(dx, dy)
 
-        angle_diff = (angle_face - phi + np.pi + 2*np.pi) % (2*np.pi) - np.pi
+        if d <= 0: return True
+        if d > self.r: return False
 
-        # print("angle_diff", angle_diff * 180 / np.pi) if d <= self.r else None
+        phi = atan2(dx, dy)
+        angle_diff = (self._face - phi + np.pi + 2*np.pi) % (2*np.pi) - np.pi
 
-        # print(-angle_view/2 <= angle_diff <= angle_view/2) if d <= self.r else None
+        return -self._view/2 <= angle_diff <= self._view/2
 
-        return d <= self.r and -angle_view/2 <= angle_diff <= angle_view/2
 
-@dataclass(init=True, repr=True, eq=True)
+@dataclass(init=False, repr=True, eq=True, frozen=True)
 class ComplexArea(MathematicalArea):
-    __consists_of: list[MathematicalArea] = field(default_factory=list, init=False)
+    """
+    Points inside any positive area and inside every inverted one.
+    The partition and the bounding box of the positive areas are computed
+    once, queries outside the box are rejected without visiting children.
+    """
+    areas:     tuple[MathematicalArea, ...]
+    _positive: tuple[MathematicalArea, ...] = field(repr=False, compare=False)
+    _negative: tuple[MathematicalArea, ...] = field(repr=False, compare=False)
+    _bbox:     Optional[BBox] = field(repr=False, compare=False)
 
     def __init__(self, *areas: MathematicalArea):
-        self.__consists_of = list(areas)
-
-    def append(self, area: MathematicalArea):
-        self.__consists_of.append(area)
+        positive = tuple(area for area in areas if not area.isInverted())
+        negative = tuple(area for area in areas if area.isInverted())
+
+        bbox = _EMPTY_BBOX
+        for area in positive:
+            other = area.bbox()
+            if other is None:
+                bbox = None
+                break
+            bbox = min(bbox[0], other[0]), max(bbox[1], other[1]), \
+                min(bbox[2], other[2]), max(bbox[3], other[3])
+
+        object.__setattr__(self, 'areas', areas)
+        object.__setattr__(self, '_positive', positive)
+        object.__setattr__(self, '_negative', negative)
+        object.__setattr__(self, '_bbox', bbox)
 
     def get(self, i):
-        return self.__consists_of[i]
+        return self.areas[i]
 
-    def _contains(self, item: tuple[float, float]):
-        positive = []
-        negative = []
+    def bbox(self) -> Optional[BBox]:
+        return self._bbox
 
-        for area in self.__consists_of:
-            if area.isInverted():
-                negative.append(area)
-            else:
-                positive.append(area)
+    def _contains(self, item: tuple[float, float]):
+        bbox = self._bbox
+        if bbox is not None and not (bbox[0] <= item[0] <= bbox[1] and bbox[2] <= item[1] <= bbox[3]):
+            return False
 
-        return any(item in area for area in positive) \
-            and all(item in area for area in negative)
+        return any(item in area for area in self._positive) \
+            and all(item in area for area in self._negative)
 
-def get_duckietile_area(sign: str) -> ComplexArea:
-    return {'floor': lambda _, __: ComplexArea(),
+_DUCKIETILE_AREAS = {'floor': lambda _, __: ComplexArea(),
         'straight/W': lambda cx, cy: RectArea(cx - 0.425, cx + 0.425, cy - 0.5, cy + 0.5),
         'straight/N': lambda cx, cy: RectArea(cx - 0.5, cx + 0.5, cy - 0.425, cy + 0.425),
         'curve_left/N': lambda cx, cy: ComplexArea(
@@ -254,7 +322,15 @@ def get_duckietile_area(sign: str) -> ComplexArea:
         '4way': lambda cx, cy: ComplexArea(
             RectArea(cx - 0.5, cx + 0.5, cy - 0.425, cy + 0.425),
             RectArea(cx - 0.425, cx + 0.425, cy - 0.5, cy + 0.5)
-        )}[sign]
+        )}
+
+def get_duckietile_area(sign: str) -> ComplexArea:
+    return _DUCKIETILE_AREAS[sign]
+
+@lru_cache(maxsize=None)
+def duckietile_area(sign: str) -> MathematicalArea:
+    """Cached area of a tile centered at the origin, translate query points by the tile center"""
+    return _DUCKIETILE_AREAS[sign](0.0, 0.0)
 
 if __name__ == '__main__':
     point = (0.5, 0.5)
@@ -1,9 +1,22 @@
-from ..model.model import DataStock, MapData
-from ..map_builder import MapBuilder
+from model.model import DataStock, MapData
+from model.dirty import DirtyQueue
+from model.region import Region
+from model.session import SessionStore
+from map_builder import MapBuilder
+from map_generator import MapGenerator
+from tileproc.tile_compiler import TileSet
+from jobs import Job, JobScheduler
+from instrument import INSTRUMENTS
+from thumbnails import ThumbnailCache
+from view.texture_grid import TextureGrid
 
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, Optional, Tuple
+from functools import partial
+from os.path import basename
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
 
 import numpy as np
 import pygame
@@ -29,6 +42,14 @@ class _Window:
         self.opened = True
 
 
+@dataclass(init=True, repr=True, eq=False)
+class _Generation:
+    model: MapData
+    states: Iterator[np.ndarray]
+    tiles: TileSet
+    state: Optional[np.ndarray] = None
+
+
 class View(ABC):
     @abstractmethod
     def setup(self, stock: Optional[DataStock], *, size: Tuple):
@@ -44,41 +65,96 @@ class View(ABC):
 
 
 class PygameImguiView(View):
+    _TOOLS = ('Toggle', 'Line', 'Rect', 'Fill')
+    _RENDERERS = ('Texture', 'Widgets')
+    _IDLE_TIMEOUT_MS = 100
+    _GENERATION_BUDGET_S = 0.008
+    _EXTRA_FRAMES = 3
+    _THUMB_SIZE = 96
+    _THUMB_TEXTURES = 256
+
     def __init__(self):
         super().__init__()
         self.main_menu = dict()
         self.map_menu  = dict()
         self._delete_list = list()
-
-    def setup(self, stock: Optional[DataStock] = DataStock(), *, size: tuple) -> None:
-        '''View setup. Call after init.'''
+        self._tool = 'Toggle'
+        self._anchor = None
+        self._colors = dict()
+        self._grids = dict()
+        self._renderer = 'Texture'
+        self._stats_opened = False
+        self._generations = list()
+        self._jobs = JobScheduler()
+        self._gallery_opened = False
+        self._gallery_dir = '.'
+        self._gallery_paths = list()
+        self._thumbs = OrderedDict()
+        self._thumb_pending = dict()
+        self._thumb_jobs = JobScheduler(threads=2)
+
+    def setup(self, stock: Optional[DataStock] = DataStock(), *, size: tuple,
+              session: Optional[SessionStore] = None, fps: int = 60, idle: bool = True) -> None:
+        '''
+        View setup. Call after init.
+        With `idle` the window is only redrawn on input, model changes and job
+        progress, `fps` caps the frame rate (0 for no cap).
+        '''
 
         MAP_NEW_WINDOW = _Window("New", 
-            dict(name="new_map", width=10, height=10, inject=False), 
+            dict(name="new_map", width=10, height=10, inject=False, sparse=False), 
             self._newMapOnClick)
         MAP_LOAD_WINDOW = _Window("Load", 
             dict(name="new_map"), 
             self._loadMapOnClick)
+        MAP_GENERATE_WINDOW = _Window("Generate",
+            dict(name="generated", width=10, height=10),
+            self._generateMapOnClick)
 
         QUIT_ITEM = tuple([_Item("Quit", "Cmd+Q", self.stop)])
-        SAVE_MAP_ITEM = tuple([_Item("Save", None, MapBuilder.parse)])
+        SAVE_ALL_ITEM = tuple([_Item("Save All", "Ctrl+S", self._saveAllOnClick)]) if session else tuple()
+        SAVE_MAP_ITEM = tuple([_Item("Save", None, self._saveMapOnClick)])
+        EDIT_MAP_ITEMS = (_Item("Undo", "Ctrl+Z", self._undoOnClick),
+                          _Item("Redo", "Ctrl+Y", self._redoOnClick))
 
         self._main_bar_windows = [
-            MAP_NEW_WINDOW, MAP_LOAD_WINDOW
+            MAP_NEW_WINDOW, MAP_LOAD_WINDOW, MAP_GENERATE_WINDOW
         ]
 
         if 'File' not in self.main_menu:
             self.main_menu['File'] = tuple()
         for window in self._main_bar_windows:
             self.main_menu['File'] += tuple([_Item(window.label, None, window.setOpened)])
+        self.main_menu['File'] += SAVE_ALL_ITEM
         self.main_menu['File'] += QUIT_ITEM
+        if 'View' not in self.main_menu:
+            self.main_menu['View'] = tuple()
+        self.main_menu['View'] += tuple([_Item("Stats", None, self._statsOnClick),
+                                         _Item("Gallery", None, self._galleryOnClick)])
 
         if 'File' not in self.map_menu:
             self.map_menu['File'] = tuple()
         self.map_menu['File'] += SAVE_MAP_ITEM
+        if 'Edit' not in self.map_menu:
+            self.map_menu['Edit'] = tuple()
+        self.map_menu['Edit'] += EDIT_MAP_ITEMS
+        if 'Tool' not in self.map_menu:
+            self.map_menu['Tool'] = tuple()
+        self.map_menu['Tool'] += tuple(_Item(tool, None, partial(self._setToolOnClick, tool))
+                                       for tool in PygameImguiView._TOOLS)
+        if 'View' not in self.map_menu:
+            self.map_menu['View'] = tuple()
+        self.map_menu['View'] += tuple(_Item(renderer, None, partial(self._setRendererOnClick, renderer))
+                                       for renderer in PygameImguiView._RENDERERS)
 
         self._size = size[:2]
         self._stock = stock
+        self._session = session
+        self._fps = fps
+        self._idle = idle
+        self._dirty = True
+        self._frames_left = PygameImguiView._EXTRA_FRAMES
+        self._stock.subscribe(self._onStockChanged)
 
         pygame.init()
         pygame.display.set_mode(self._size, pygame.DOUBLEBUF | pygame.OPENGL | pygame.RESIZABLE)
@@ -90,27 +166,64 @@ class PygameImguiView(View):
         self._io = imgui.get_io()
         self._io.display_size = self._size
 
+        self._clock = pygame.time.Clock()
+        self._wake_event = pygame.event.custom_type()
+
         self._running = True
     
     def run(self):
         """Runs gui main cycle"""
         print('[View] Run')
         while self._running:
-            self._render()
+            self._render(self._waitEvents())
+            if self._fps > 0:
+                self._clock.tick(self._fps)
+            else:
+                self._clock.tick()
+            INSTRUMENTS.record('view.frameInterval', self._clock.get_time())
         
         self._closeWindow()
 
+    def _onStockChanged(self, name, region, version):
+        # may be called from worker threads, posting an event wakes the idle loop
+        if not self._dirty:
+            self._dirty = True
+            pygame.event.post(pygame.event.Event(self._wake_event))
+
+    def _wantsRedraw(self) -> bool:
+        # jobs are only polled in _render, completion callbacks must not run while waiting
+        return self._frames_left > 0 or self._dirty or self._jobs.hasUpdates() \
+            or self._thumb_jobs.hasUpdates() or len(self._generations) > 0
+
+    def _waitEvents(self) -> list:
+        """Blocks in idle mode until there is something to redraw"""
+        events = pygame.event.get()
+
+        while self._idle and not events and not self._wantsRedraw():
+            event = pygame.event.wait(PygameImguiView._IDLE_TIMEOUT_MS)
+            if event.type != pygame.NOEVENT:
+                events = [event] + pygame.event.get()
+
+        if events:
+            # imgui needs a few frames to settle hover and click states
+            self._frames_left = PygameImguiView._EXTRA_FRAMES
+        return [event for event in events if event.type != self._wake_event]
+
     def stop(self):
         print('[View] Stop')
         self._running = False
 
     def _closeWindow(self):
+        self._jobs.shutdown()
+        self._thumb_jobs.shutdown()
+        self._Gallery_release()
         pygame.display.quit()
         pygame.quit()
 
-    def _render(self):
+    @INSTRUMENTS.timed('view.render')
+    def _render(self, events: list):
         # proccess events
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 self.stop()
                 return
@@ -118,6 +231,12 @@ class PygameImguiView(View):
             
         self._impl.process_inputs()
 
+        self._jobs.poll()
+        self._thumb_jobs.poll()
+
+        # cleared before drawing, changes made by workers during the frame wake the loop again
+        self._dirty = False
+
         # prepare frame
         imgui.new_frame()
         self._clearScreen()
@@ -128,14 +247,256 @@ class PygameImguiView(View):
         self._impl.render(imgui.get_draw_data())
         pygame.display.flip()
 
-    def _newMapOnClick(self, *, name, width, height, inject):
+        self._frames_left = max(self._frames_left - 1, 0)
+
+    def _newMapOnClick(self, *, name, width, height, inject, sparse):
         print(f'[View][MainMenu][onClick] New')
-        self._stock.addData(name, MapData(name, (width, height), inject=inject))
+        self._stock.addData(name, MapData(name, (width, height), inject=inject, sparse=sparse))
 
     def _loadMapOnClick(self, *, name):
         print(f'[View][MainMenu][onClick] Load')
-        data = MapBuilder.load(name)
-        self._stock.addData(name, MapData(name, data.shape[:2], data))
+        self._jobs.submit(f'Load {name}', lambda progress: MapBuilder.load(name),
+            onDone=lambda data: self._stock.addData(name, MapData(name, data.shape[:2], data)))
+
+    def _generateMapOnClick(self, *, name, width, height):
+        print(f'[View][MainMenu][onClick] Generate')
+        model = MapData(name, (width, height))
+        self._stock.addData(name, model)
+
+        tiles = MapGenerator._loadTiles()
+        self._generations.append(_Generation(model, MapGenerator.iterate((width, height), tiles), tiles))
+
+    @INSTRUMENTS.timed('view.generationStep')
+    def _Generation_step(self, generation: _Generation) -> bool:
+        """Advances a generation for a fixed time budget and streams it into its model"""
+        deadline = perf_counter() + PygameImguiView._GENERATION_BUDGET_S
+        finished = False
+
+        while perf_counter() < deadline:
+            try:
+                generation.state = next(generation.states)
+            except StopIteration:
+                finished = True
+                break
+
+        model = generation.model
+        preview = MapGenerator.stateToBitmap(generation.state, generation.tiles, model.getSize())
+        model.setRegion(Region.ofSize(model.getSize()), preview, record=False)
+
+        return finished
+
+    def _Generations_draw(self):
+        for generation in list(self._generations):
+            if generation.model.name not in self._stock.getNames() \
+                    or self._Generation_step(generation):
+                self._generations.remove(generation)
+
+        if not self._generations:
+            return
+
+        with imgui.begin("Generation", flags=imgui.WINDOW_NO_COLLAPSE
+                        | imgui.WINDOW_ALWAYS_AUTO_RESIZE):
+            for generation in list(self._generations):
+                name = generation.model.name
+                imgui.push_id(f'gen{name}')
+                imgui.progress_bar(MapGenerator.collapsedFraction(generation.state), (200, 0), name)
+                imgui.same_line()
+                if imgui.button('Stop'):
+                    print(f'[View][Generation] Stop {name}')
+                    self._generations.remove(generation)
+                imgui.pop_id()
+
+    def _saveMapOnClick(self, *, name, bitmap, inject):
+        print(f'[View][MapMenu][onClick] Save')
+        self._jobs.submit(f'Save {name}', MapBuilder.parse, name, np.array(bitmap), inject=inject)
+
+    def _statsOnClick(self):
+        self._stats_opened = not self._stats_opened
+
+    def _Stats_draw(self):
+        if not self._stats_opened:
+            return
+
+        with imgui.begin("Stats", closable=True, flags=imgui.WINDOW_ALWAYS_AUTO_RESIZE) as window:
+            if not window.opened:
+                self._stats_opened = False
+                return
+            for name in INSTRUMENTS.getNames():
+                history = INSTRUMENTS.getHistory(name)
+                imgui.plot_lines(name, history, overlay_text=f'{history[-1]:.2f} ms',
+                                 scale_min=0.0, graph_size=(240, 40))
+            for name, value in INSTRUMENTS.getCounters().items():
+                imgui.text(f'{name}: {value}')
+            if imgui.button('Export JSON'):
+                INSTRUMENTS.dump('stats.json')
+
+    def _galleryOnClick(self):
+        self._gallery_opened = not self._gallery_opened
+        if self._gallery_opened:
+            self._Gallery_scan()
+
+    def _Gallery_scan(self):
+        directory = self._gallery_dir
+        self._jobs.submit(f'Scan {directory}', lambda progress: ThumbnailCache.scan(directory),
+            onDone=self._Gallery_setPaths)
+
+    def _Gallery_setPaths(self, paths: list[str]):
+        self._Gallery_release()
+        self._gallery_paths = paths
+
+    def _Gallery_release(self):
+        for job in self._thumb_jobs.getJobs():
+            job.cancel()
+        self._thumb_pending.clear()
+        for thumb in self._thumbs.values():
+            if thumb is not None:
+                gl.glDeleteTextures([thumb[0]])
+        self._thumbs.clear()
+
+    def _Gallery_drop(self, path: str):
+        """Forgets a thumbnail, cancelling its decoding or deleting its texture"""
+        thumb = self._thumbs.pop(path, None)
+        job = self._thumb_pending.pop(path, None)
+        if job is not None:
+            job.cancel()
+        if thumb is not None:
+            gl.glDeleteTextures([thumb[0]])
+
+    def _Gallery_evict(self):
+        # least recently drawn thumbnails go first, placeholders count too
+        while len(self._thumbs) > PygameImguiView._THUMB_TEXTURES:
+            self._Gallery_drop(next(iter(self._thumbs)))
+
+    def _Gallery_cancelHidden(self, visible: set[str]):
+        """Cancels decoding of thumbnails scrolled out of view, they are requested again when drawn"""
+        for path in [path for path in self._thumb_pending if path not in visible]:
+            self._Gallery_drop(path)
+
+    def _Gallery_upload(self, path: str, level: np.ndarray):
+        self._thumb_pending.pop(path, None)
+        if path not in self._thumbs or self._thumbs[path] is not None:
+            return
+        self._thumbs[path] = TextureGrid.createTexture(np.repeat(level[..., None], 3, axis=2)), level.shape
+
+    def _Gallery_failed(self, path: str, error: BaseException):
+        print(f'[View][Gallery] {path}: {error}')
+        # retried the next time the thumbnail is drawn
+        self._thumb_pending.pop(path, None)
+        if path in self._thumbs and self._thumbs[path] is None:
+            del self._thumbs[path]
+
+    def _Gallery_texture(self, path: str) -> Optional[tuple[int, tuple[int, int]]]:
+        """Texture and shape of a thumbnail, decoding is only started once the thumbnail is on screen"""
+        if path in self._thumbs:
+            self._thumbs.move_to_end(path)
+            return self._thumbs[path]
+
+        # None marks a thumbnail being decoded
+        self._thumbs[path] = None
+        self._thumb_pending[path] = self._thumb_jobs.submit(f'Thumbnail {path}',
+            lambda progress: ThumbnailCache.load(path, PygameImguiView._THUMB_SIZE),
+            onDone=partial(self._Gallery_upload, path),
+            onError=partial(self._Gallery_failed, path))
+        self._Gallery_evict()
+        return None
+
+    def _Gallery_draw(self):
+        if not self._gallery_opened:
+            self._Gallery_cancelHidden(set())
+            return
+
+        imgui.set_next_window_size(480, 480, imgui.FIRST_USE_EVER)
+        with imgui.begin("Gallery", closable=True) as window:
+            if not window.opened:
+                self._gallery_opened = False
+                self._Gallery_cancelHidden(set())
+                return
+
+            _, self._gallery_dir = imgui.input_text('directory', self._gallery_dir, 256)
+            imgui.same_line()
+            if imgui.button('Refresh'):
+                self._Gallery_scan()
+            imgui.text(f'{len(self._gallery_paths)} maps')
+
+            size = PygameImguiView._THUMB_SIZE
+            cell = size + imgui.get_style().item_spacing.x
+            imgui.begin_child('thumbnails', 0, 0, border=False)
+            columns = max(int(imgui.get_content_region_available()[0] // cell), 1)
+            rows = (len(self._gallery_paths) + columns - 1) // columns
+
+            # only rows in view are drawn, their thumbnails are decoded on first sight
+            visible = set()
+            clipper = imgui.ListClipper()
+            clipper.begin(rows, size + imgui.get_text_line_height_with_spacing() + imgui.get_style().item_spacing.y)
+            while clipper.step():
+                for row in range(clipper.display_start, clipper.display_end):
+                    for column, path in enumerate(self._gallery_paths[row*columns:(row + 1)*columns]):
+                        visible.add(path)
+                        if column > 0:
+                            imgui.same_line()
+                        imgui.begin_group()
+                        imgui.push_id(path)
+                        thumb = self._Gallery_texture(path)
+                        if thumb is None:
+                            imgui.button('...', size, size)
+                            clicked = False
+                        else:
+                            # keeps the aspect ratio, the dummy pads every cell to the same size
+                            texture, (w, h) = thumb
+                            scale = size / max(w, h)
+                            clicked = imgui.image_button(texture, w * scale, h * scale, frame_padding=0)
+                            if w != h:
+                                imgui.dummy(size, size - h * scale)
+                        if clicked:
+                            self._loadMapOnClick(name=path)
+                        imgui.text(basename(path)[:12])
+                        imgui.pop_id()
+                        imgui.end_group()
+            clipper.end()
+            imgui.end_child()
+            self._Gallery_cancelHidden(visible)
+
+    def _saveAllOnClick(self):
+        print(f'[View][MainMenu][onClick] Save All')
+        self._session.save(self._stock)
+
+    def _undoOnClick(self, *, name, **_):
+        self._stock.getData(name).undo()
+
+    def _redoOnClick(self, *, name, **_):
+        self._stock.getData(name).redo()
+
+    def _setToolOnClick(self, tool: str, **_):
+        print(f'[View][MapMenu][onClick] Tool {tool}')
+        self._tool = tool
+        self._anchor = None
+
+    def _setRendererOnClick(self, renderer: str, **_):
+        print(f'[View][MapMenu][onClick] Renderer {renderer}')
+        self._renderer = renderer
+
+    def _Data_onClick(self, model: MapData, x: int, y: int):
+        """Applies the current tool to the clicked cell"""
+        match self._tool:
+            case 'Toggle':
+                model.buttonOnClick(x, y)
+            case 'Fill':
+                model.floodFill(x, y, 255 ^ int(model.getValue(x, y)))
+            case 'Line' | 'Rect':
+                if self._anchor is None or self._anchor[0] != model.name:
+                    self._anchor = (model.name, x, y)
+                    return
+                _, ax, ay = self._anchor
+                value = 255 ^ int(model.getValue(ax, ay))
+                if self._tool == 'Line':
+                    model.drawLine((ax, ay), (x, y), value)
+                else:
+                    model.fillRect(Region(min(ax, x), min(ay, y), max(ax, x) + 1, max(ay, y) + 1), value)
+                self._anchor = None
+
+    def _Data_args(self, model: MapData) -> dict:
+        """Keyword arguments passed to map menu items"""
+        return dict(name=model.name, bitmap=model.bitmap, inject=model.inject)
 
     def _Window_updateSettings(self, imw: _Window):
         for setting in imw.settings:
@@ -161,28 +522,86 @@ class PygameImguiView(View):
             else:
                 imw.opened = False
         
-    def _Data_draw(self, model_name):
-        model = self._stock.getData(model_name)
+    def _Data_colors(self, model_name: str, model: MapData) -> np.ndarray:
+        """Per-cell colors of a model, recomputed only where the model changed"""
+        if model_name not in self._colors:
+            queue = DirtyQueue()
+            unsubscribe = model.subscribe(queue.push)
+            queue.push(Region.ofSize(model.getSize()))
+            self._colors[model_name] = (queue, unsubscribe, np.zeros((*model.getSize(), 3), dtype=np.float32))
+
+        queue, _, colors = self._colors[model_name]
+        for region in queue.drain():
+            rgb = model.value2color(model.getRegion(region))
+            colors[region.slices] = np.stack(np.broadcast_arrays(*rgb), axis=-1)
+
+        return colors
+
+    def _Data_visibleColumns(self, w: int, butt_width: float) -> tuple[int, int]:
+        """Range of columns inside the current child region"""
+        scroll_x = imgui.get_scroll_x()
+        first = max(int(scroll_x // butt_width), 0)
+        last  = int((scroll_x + imgui.get_window_width()) // butt_width) + 1
+        return min(first, w), min(last, w)
+
+    def _Data_drawWidgets(self, model_name: str, model: MapData):
+        colors = self._Data_colors(model_name, model)
         w, h = model.getSize()
         butt_size = 20, 20
+
+        imgui.begin_child('cells', 0, 0, border=False, flags=imgui.WINDOW_HORIZONTAL_SCROLLBAR)
+        imgui.push_style_var(imgui.STYLE_ITEM_SPACING, (0.0, 0.0))
+
+        # only cells in view are emitted, dummies keep the scrollable area of the full map
+        x_first, x_last = self._Data_visibleColumns(w, butt_size[0])
+        clipper = imgui.ListClipper()
+        clipper.begin(h, butt_size[1])
+        while clipper.step():
+            INSTRUMENTS.count('view.cells', (clipper.display_end - clipper.display_start) * (x_last - x_first))
+            for y in range(clipper.display_start, clipper.display_end):
+                if x_first > 0:
+                    imgui.dummy(x_first * butt_size[0], butt_size[1])
+                for x in range(x_first, x_last):
+                    if x > 0:
+                        imgui.same_line()
+                    imgui.push_id(f'{y*w + x}')
+                    if imgui.color_button('', *colors[x, y], *butt_size):
+                        self._Data_onClick(model, x, y)
+                    imgui.pop_id()
+                if x_last < w:
+                    imgui.same_line()
+                    imgui.dummy((w - x_last) * butt_size[0], butt_size[1])
+        clipper.end()
+
+        imgui.pop_style_var()
+        imgui.end_child()
+
+    def _Data_drawTexture(self, model_name: str, model: MapData):
+        if model_name not in self._grids:
+            self._grids[model_name] = TextureGrid(model)
+
+        clicked = self._grids[model_name].draw()
+        if clicked is not None:
+            self._Data_onClick(model, *clicked)
+
+    @INSTRUMENTS.timed('view.dataDraw')
+    def _Data_draw(self, model_name):
+        model = self._stock.getData(model_name)
+
+        imgui.set_next_window_size(480, 480, imgui.FIRST_USE_EVER)
+        if self._renderer == 'Texture':
+            flags = imgui.WINDOW_NO_SCROLLBAR | imgui.WINDOW_NO_SCROLL_WITH_MOUSE
+        else:
+            flags = imgui.WINDOW_NO_SCROLLBAR
         
-        with imgui.begin(model_name, closable=True, 
-                        flags=imgui.WINDOW_NO_RESIZE
-                        | imgui.WINDOW_ALWAYS_AUTO_RESIZE) as window:
+        with imgui.begin(model_name, closable=True, flags=flags) as window:
             if window.opened:
                 for menu_name in self.map_menu:
-                    self._Menu_add(menu_name, self.map_menu[menu_name], model.__dict__)
-                imgui.push_style_var(imgui.STYLE_ITEM_SPACING, (0.0, 0.0))
-                for y in range(h):
-                    for x in range(w):
-                        if x > 0:
-                            imgui.same_line()
-                        imgui.push_id(f'{y*w + x}')
-                        color = model.value2color(model.getValue(x, y))
-                        if imgui.color_button('', *color, *butt_size):
-                            model.buttonOnClick(x, y)
-                        imgui.pop_id()
-                imgui.pop_style_var()
+                    self._Menu_add(menu_name, self.map_menu[menu_name], self._Data_args(model))
+                if self._renderer == 'Texture':
+                    self._Data_drawTexture(model_name, model)
+                else:
+                    self._Data_drawWidgets(model_name, model)
             else:
                 self._delete_list.append(model_name)
                     
@@ -202,6 +621,23 @@ class PygameImguiView(View):
                 for menu_name in self.main_menu:
                     self._Menu_add(menu_name, self.main_menu[menu_name])
 
+    def _Jobs_draw(self):
+        jobs = self._jobs.getJobs()
+        if not jobs:
+            return
+
+        with imgui.begin("Jobs", flags=imgui.WINDOW_NO_COLLAPSE
+                        | imgui.WINDOW_ALWAYS_AUTO_RESIZE):
+            for job in jobs:
+                imgui.push_id(f'job{job.id}')
+                imgui.progress_bar(job.progress, (200, 0), job.label)
+                imgui.same_line()
+                if job.isCancelled():
+                    imgui.text(Job.CANCELLED)
+                elif imgui.button('Cancel'):
+                    job.cancel()
+                imgui.pop_id()
+
     def _drawAdditionalWindows(self):
         for window in self._main_bar_windows:
             if window.opened:
@@ -209,12 +645,22 @@ class PygameImguiView(View):
 
     def _Data_clear(self):
         while len(self._delete_list) > 0:
-            self._stock.delData(self._delete_list.pop())
-
+            model_name = self._delete_list.pop()
+            if model_name in self._colors:
+                self._colors.pop(model_name)[1]()
+            if model_name in self._grids:
+                self._grids.pop(model_name).release()
+            self._stock.delData(model_name)
+
+    @INSTRUMENTS.timed('view.drawFrame')
     def _drawFrame(self):
         self._MainMenu_draw()
 
         self._drawAdditionalWindows()
+        self._Jobs_draw()
+        self._Generations_draw()
+        self._Stats_draw()
+        self._Gallery_draw()
 
         for model_name in self._stock.getNames():
             self._Data_draw(model_name)
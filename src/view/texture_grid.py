@@ -0,0 +1,153 @@
+from model.dirty import DirtyQueue
+from model.model import MapData
+from model.region import Region
+
+from typing import Optional
+
+import numpy as np
+import OpenGL.GL as gl
+import imgui
+
+class TextureGrid:
+    """
+    Draws a MapData as OpenGL textures.
+
+    Maps larger than GL_MAX_TEXTURE_SIZE are split into square tiles of that
+    size, one texture each. Cell (x, y) is texel (x - tile.x_min, y - tile.y_min)
+    of its tile's texture, only regions reported dirty by the model are
+    re-uploaded. Every frame draws just the tiles in view, so the per-frame
+    cost does not depend on the map size. Wheel zooms around the cursor,
+    right drag pans.
+    """
+    ZOOM_MIN = 1.0
+    ZOOM_MAX = 64.0
+
+    def __init__(self, model: MapData, zoom: float = 20.0):
+        self.zoom = zoom
+        self.pan = np.zeros(2, dtype=np.float64)
+        self._model = model
+        self._size = model.getSize()
+        self._queue = DirtyQueue()
+        self._unsubscribe = model.subscribe(self._queue.push)
+        self._queue.push(Region.ofSize(self._size))
+
+        tile = TextureGrid.maxTextureSize()
+        self._tiles: list[tuple[int, Region]] = [
+            (TextureGrid._emptyTexture(bounds), bounds)
+            for x in range(0, self._size[0], tile) for y in range(0, self._size[1], tile)
+            for bounds in [Region(x, y, x + tile, y + tile).intersection(Region.ofSize(self._size))]]
+
+    def maxTextureSize() -> int:
+        return int(gl.glGetIntegerv(gl.GL_MAX_TEXTURE_SIZE))
+
+    def _emptyTexture(bounds: Region) -> int:
+        texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP_TO_EDGE)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP_TO_EDGE)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGB, bounds.shape[0], bounds.shape[1], 0,
+                        gl.GL_RGB, gl.GL_UNSIGNED_BYTE, None)
+        return texture
+
+    def createTexture(rgb: np.ndarray) -> int:
+        """Static texture from a (width, height, 3) uint8 array, texel (x, y) is rgb[x, y]"""
+        data = np.ascontiguousarray(np.asarray(rgb, dtype=np.uint8).transpose(1, 0, 2))
+        texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGB, data.shape[1], data.shape[0], 0,
+                        gl.GL_RGB, gl.GL_UNSIGNED_BYTE, data)
+        return texture
+
+    def release(self) -> None:
+        self._unsubscribe()
+        gl.glDeleteTextures([texture for texture, _ in self._tiles])
+
+    def _colors(self, region: Region) -> np.ndarray:
+        rgb = self._model.value2color(self._model.getRegion(region))
+        rgb = np.stack(np.broadcast_arrays(*rgb), axis=-1)
+        return np.clip(rgb * 255, 0, 255).astype(np.uint8)
+
+    def _upload(self) -> None:
+        rects = self._queue.drain()
+        if not rects:
+            return
+
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        for texture, bounds in self._tiles:
+            parts = [part for part in (region.intersection(bounds) for region in rects) if part is not None]
+            if not parts:
+                continue
+
+            gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+            for part in parts:
+                # texture rows are indexed by y
+                data = np.ascontiguousarray(self._colors(part).transpose(1, 0, 2))
+                gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, part.x_min - bounds.x_min, part.y_min - bounds.y_min,
+                                   part.shape[0], part.shape[1], gl.GL_RGB, gl.GL_UNSIGNED_BYTE, data)
+
+    def _clampPan(self, view: np.ndarray) -> None:
+        limit = np.maximum(np.asarray(self._size, dtype=np.float64) - view / self.zoom, 0.0)
+        self.pan = np.clip(self.pan, 0.0, limit)
+
+    def _handleInput(self, origin: np.ndarray, view: np.ndarray) -> None:
+        io = imgui.get_io()
+        mouse = np.asarray(io.mouse_pos, dtype=np.float64) - origin
+
+        if io.mouse_wheel != 0:
+            anchor = self.pan + mouse / self.zoom
+            self.zoom = float(np.clip(self.zoom * 1.1**io.mouse_wheel, TextureGrid.ZOOM_MIN, TextureGrid.ZOOM_MAX))
+            self.pan = anchor - mouse / self.zoom
+
+        if imgui.is_mouse_dragging(1):
+            self.pan -= np.asarray(io.mouse_delta, dtype=np.float64) / self.zoom
+
+        self._clampPan(view)
+
+    def cellAt(self, local: tuple[float, float]) -> Optional[tuple[int, int]]:
+        """Cell under a point given relative to the image origin"""
+        x, y = np.floor(self.pan + np.asarray(local, dtype=np.float64) / self.zoom).astype(int)
+        if 0 <= x < self._size[0] and 0 <= y < self._size[1]:
+            return int(x), int(y)
+        return None
+
+    def draw(self) -> Optional[tuple[int, int]]:
+        """Draws the map into the current window, returns the clicked cell"""
+        self._upload()
+
+        available = np.asarray(imgui.get_content_region_available(), dtype=np.float64)
+        size = np.asarray(self._size, dtype=np.float64)
+        self._clampPan(available)
+        view = np.minimum(available, (size - self.pan) * self.zoom)
+        if np.any(view <= 0):
+            return None
+
+        origin = np.asarray(imgui.get_cursor_screen_pos(), dtype=np.float64)
+        low, high = self.pan, self.pan + view / self.zoom
+
+        # the dummy takes the layout space and hover of the whole view, tiles in view are drawn over it
+        imgui.dummy(view[0], view[1])
+        draw_list = imgui.get_window_draw_list()
+        for texture, bounds in self._tiles:
+            start = np.asarray((bounds.x_min, bounds.y_min), dtype=np.float64)
+            end = np.asarray((bounds.x_max, bounds.y_max), dtype=np.float64)
+            first, last = np.maximum(low, start), np.minimum(high, end)
+            if np.any(first >= last):
+                continue
+            draw_list.add_image(texture,
+                                tuple(origin + (first - self.pan) * self.zoom),
+                                tuple(origin + (last - self.pan) * self.zoom),
+                                tuple((first - start) / (end - start)), tuple((last - start) / (end - start)))
+
+        if not imgui.is_item_hovered():
+            return None
+
+        self._handleInput(origin, available)
+
+        if imgui.is_mouse_clicked(0):
+            return self.cellAt(np.asarray(imgui.get_io().mouse_pos) - origin)
+        return None